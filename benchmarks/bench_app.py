@@ -0,0 +1,281 @@
+"""
+End to end benchmark of `App`, offline.
+
+`ytmusicapi` and `yt_dlp` are replaced by local stand-ins before the app is imported:
+the playlist is a synthetic one of `--tracks` tracks and every download fetches an audio
+fixture from a local HTTP server, reporting progress like yt-dlp does. `Config.FFMPEG_PATH`
+points to a shell script that copies its input, so converting costs a process spawn and
+no CPU. Everything runs in a scratch folder.
+
+Each phase runs in a fresh interpreter:
+
+- "cold" starts on an empty folder and processes the whole playlist.
+- "warm" starts again once everything is done, the cost of a run with nothing to do.
+- "state" loads and saves the state of the finished library.
+
+Reported are startup time (importing and building `App`), run time and tracks per second, state load
+and save times, and the peak RSS of each phase. Run from the repository root:
+
+    python benchmarks/bench_app.py --tracks 10000 --workers 8
+"""
+
+import sys, os, json, time, types, argparse, resource, tempfile, threading, subprocess
+import http.server, urllib.request
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+PLAYLIST_ID = "PLbenchapp"
+
+# Copies the file after the first -i to the last argument, like a stream copy would.
+FAKE_FFMPEG = """#!/bin/sh
+src=""
+prev=""
+for arg; do
+    if [ "$prev" = "-i" ] && [ -z "$src" ]; then src="$arg"; fi
+    prev="$arg"
+done
+cp "$src" "$arg"
+"""
+
+
+class AudioHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the audio fixture for any path, honouring range requests. The path is put in
+    front of it, so every track is a different recording.
+    """
+
+    payload = b""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        payload = self.path.encode("utf-8") + AudioHandler.payload
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range is not None and byte_range.startswith("bytes="):
+            start = int(byte_range[len("bytes=") :].split("-")[0] or 0)
+        self.send_response(206 if start > 0 else 200)
+        self.send_header("Content-Type", "audio/webm")
+        self.send_header("Content-Length", str(len(payload) - start))
+        self.end_headers()
+        self.wfile.write(payload[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def install_fakes(server_url: str, track_count: int) -> None:
+    """
+    Puts stand-ins for `ytmusicapi` and `yt_dlp` in `sys.modules`.
+    """
+
+    class YTMusic:
+        def get_playlist(self, playlist_id, limit=100):
+            count = track_count if limit is None else min(limit, track_count)
+            tracks = [
+                {
+                    "videoId": f"v{i:09d}",
+                    "title": f"Track {i}",
+                    "artists": [{"name": f"Artist {i % 500}"}],
+                    "album": {"name": f"Album {i % 2000}"},
+                    "thumbnails": [],
+                }
+                for i in range(count)
+            ]
+            return {"id": playlist_id, "trackCount": track_count, "tracks": tracks}
+
+    class YoutubeDL:
+        def __init__(self, params=None):
+            self.params = dict(params or {})
+
+        def extract_info(self, url, download=True):
+            info = {"id": url, "ext": "webm", "format_id": "251"}
+            file_path = self.prepare_filename(info)
+            with urllib.request.urlopen(f"{server_url}/audio/{url}") as response:
+                data = response.read()
+            Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+            Path(file_path).write_bytes(data)
+            for hook in self.params.get("progress_hooks", []):
+                hook(
+                    {
+                        "status": "finished",
+                        "downloaded_bytes": len(data),
+                        "total_bytes": len(data),
+                        "filename": file_path,
+                    }
+                )
+            info["requested_downloads"] = [{"filepath": file_path}]
+            return info
+
+        def prepare_filename(self, info):
+            outtmpl = self.params["outtmpl"]
+            template = outtmpl["default"] if isinstance(outtmpl, dict) else outtmpl
+            for key, value in info.items():
+                template = template.replace(f"%({key})s", str(value))
+            return template
+
+        def close(self):
+            pass
+
+    sys.modules["ytmusicapi"] = types.SimpleNamespace(YTMusic=YTMusic)  # type: ignore
+    sys.modules["yt_dlp"] = types.SimpleNamespace(YoutubeDL=YoutubeDL)  # type: ignore
+
+
+def configure(workers: int, backend: str) -> None:
+    """
+    Points the app at the stand-ins and removes the limits meant for YouTube.
+    """
+    from config import Config
+
+    overrides = {
+        "FFMPEG_PATH": str(Path("ffmpeg.sh").resolve()),
+        "STATE_BACKEND": backend,
+        "DOWNLOAD_WORKERS": workers,
+        "RATE_LIMIT_REQUESTS_PER_SECOND": 0,
+        "RATE_LIMIT_BYTES_PER_SECOND": 0,
+        "ALBUM_ART": False,
+        "RETRY_WAIT_IN_RUN": 0,
+    }
+    for name, value in overrides.items():
+        setattr(Config, name, value)
+
+
+def run_app() -> dict[str, float]:
+    """
+    Imports, builds and runs the app, timing startup and run.
+    """
+    import logging
+
+    start = time.perf_counter()
+    from app import App
+
+    app = App(logging.ERROR, logging.ERROR)
+    started = time.perf_counter()
+    try:
+        app.run()
+    except SystemExit:
+        pass
+    done = time.perf_counter()
+    return {"startup": started - start, "run": done - started}
+
+
+def measure_state(backend: str) -> dict[str, float]:
+    """
+    Times loading the finished state and writing it back.
+    """
+    import utils
+    from config import Config
+    from data.mp3 import Mp3
+    from data.state import State
+    from data.sqlite_state import SqliteState
+
+    if backend == "sqlite":
+        start = time.perf_counter()
+        sqlite_state = SqliteState(Config.STATE_DB_FILE_PATH)
+        count = len(sqlite_state.by_urls)
+        done = len(sqlite_state.by_file_paths)
+        loaded = time.perf_counter()
+        sqlite_state.checkpoint()
+        saved = time.perf_counter()
+        sqlite_state.close()
+    elif backend == "jsonl":
+        start = time.perf_counter()
+        state = State.read_jsonl(Config.CONTROL_LINES_FILE_PATH)
+        count = len(state.mp3s)
+        done = sum(1 for mp3 in state.mp3s if mp3.state is Mp3.State.DONE)
+        loaded = time.perf_counter()
+        state.write_jsonl(Config.CONTROL_LINES_FILE_PATH)
+        saved = time.perf_counter()
+    else:
+        start = time.perf_counter()
+        state = State.from_json(utils.read_json_file(Config.CONTROL_FILE_PATH))
+        count = len(state.mp3s)
+        done = sum(1 for mp3 in state.mp3s if mp3.state is Mp3.State.DONE)
+        loaded = time.perf_counter()
+        utils.write_json_file(Config.CONTROL_FILE_PATH, state.to_json(), indent=None)
+        saved = time.perf_counter()
+    return {"tracks": count, "done": done, "load": loaded - start, "save": saved - loaded}
+
+
+def child(args: argparse.Namespace) -> None:
+    """
+    Runs one phase and writes its measurements to the result file.
+    """
+    install_fakes(args.server_url, args.tracks)
+    configure(args.workers, args.backend)
+    if args.phase == "state":
+        result = measure_state(args.backend)
+    else:
+        result = run_app()
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    Path(args.result).write_text(json.dumps(result), encoding="utf-8")
+
+
+def run_phase(phase: str, args: argparse.Namespace, folder: Path, server_url: str) -> dict:
+    """
+    Runs a phase in a fresh interpreter inside the scratch folder.
+    """
+    result_path = folder / f"{phase}.result.json"
+    command = [sys.executable, str(Path(__file__).resolve()), "--child", "--phase", phase]
+    command += ["--server-url", server_url, "--result", str(result_path)]
+    command += ["--tracks", str(args.tracks), "--workers", str(args.workers)]
+    command += ["--backend", args.backend]
+    subprocess.run(command, cwd=folder, check=True, stdout=subprocess.DEVNULL)
+    return json.loads(result_path.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--audio-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--backend", choices=["jsonl", "json", "sqlite"], default="jsonl")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--phase", help=argparse.SUPPRESS)
+    parser.add_argument("--server-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    AudioHandler.payload = os.urandom(args.audio_bytes)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), AudioHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as temp:
+        folder = Path(temp)
+        (folder / "playlist_url.txt").write_text(
+            f"https://music.youtube.com/playlist?list={PLAYLIST_ID}\n", encoding="utf-8"
+        )
+        ffmpeg = folder / "ffmpeg.sh"
+        ffmpeg.write_text(FAKE_FFMPEG, encoding="utf-8")
+        ffmpeg.chmod(0o755)
+
+        cold = run_phase("cold", args, folder, server_url)
+        warm = run_phase("warm", args, folder, server_url)
+        state = run_phase("state", args, folder, server_url)
+    server.shutdown()
+
+    print(f"{args.tracks} tracks, {args.workers} download workers, {args.backend} state")
+    print(
+        f"cold   startup {cold['startup']:7.3f}s  run {cold['run']:8.3f}s  "
+        f"{args.tracks / cold['run']:8.1f} tracks/s  peak RSS {cold['peak_rss_mb']:7.1f} MB"
+    )
+    print(
+        f"warm   startup {warm['startup']:7.3f}s  run {warm['run']:8.3f}s  "
+        f"{'':17}  peak RSS {warm['peak_rss_mb']:7.1f} MB"
+    )
+    print(
+        f"state  load    {state['load']:7.3f}s  save {state['save']:7.3f}s  "
+        f"{state['done']}/{state['tracks']} done  peak RSS {state['peak_rss_mb']:7.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the per-track overhead of a fresh `yt_dlp.YoutubeDL` per track against a reused
+`downloads.Downloader` session.
+
+Tracks are served by a local HTTP server, so only yt-dlp's own setup and connection cost
+is measured. Run from the repository root:
+
+    python benchmarks/bench_downloader_session.py --tracks 50
+"""
+
+import sys, time, logging, argparse, tempfile, threading, http.server
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import logic.downloads as downloads
+
+# yt-dlp options for plain files from the local server, no ffmpeg involved.
+OPTIONS = {"format": "best", "postprocessors": [], "quiet": True, "noprogress": True}
+PAYLOAD = b"\xff\xfb\x90\x00" * 16 * 1024
+
+
+class AudioHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the same small audio payload for every path.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._send_headers()
+
+    def do_GET(self):
+        self._send_headers()
+        self.wfile.write(PAYLOAD)
+
+    def _send_headers(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server() -> http.server.ThreadingHTTPServer:
+    """
+    Starts the local HTTP server on a free port.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), AudioHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(label: str, tracks: int, base_url: str, folder: Path, reuse: bool) -> float:
+    """
+    Downloads `tracks` files and returns the average seconds per track.
+    """
+    logger = logging.getLogger("bench")
+    start = time.perf_counter()
+    session = downloads.Downloader(logger, options=OPTIONS) if reuse else None
+    for i in range(tracks):
+        output_path = folder / f"{label}-{i}.mp3"
+        downloader = session or downloads.Downloader(logger, options=OPTIONS)
+        downloader.download(f"{base_url}/track{i}.mp3", output_path)
+        if session is None:
+            downloader.close()
+    if session is not None:
+        session.close()
+    per_track = (time.perf_counter() - start) / tracks
+    print(f"{label:>10}: {per_track * 1000:8.2f} ms/track")
+    return per_track
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=50)
+    args = parser.parse_args()
+
+    server = start_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    with tempfile.TemporaryDirectory() as folder:
+        fresh = run("fresh", args.tracks, base_url, Path(folder), reuse=False)
+        reused = run("reused", args.tracks, base_url, Path(folder), reuse=True)
+    server.shutdown()
+    print(f"{'saved':>10}: {(fresh - reused) * 1000:8.2f} ms/track")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Times file name allocation over synthetic unicode titles.
+
+Compares the per character `str.replace` loop file names used to be built with against
+`FileNameAllocator`, which translates with a precompiled table and suffixes names that
+collide. Titles mix accented Latin, CJK, emoji, characters invalid on Windows and a share
+of duplicates. Run from the repository root:
+
+    python benchmarks/bench_file_names.py --titles 100000
+"""
+
+import sys, re, time, random, argparse, unicodedata
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from logic.file_names import FileNameAllocator
+
+WORDS = [
+    "Love", "Night", "Café", "Señor", "Ça va", "Über", "Straße", "naïve", "São Paulo",
+    "東京", "夜に駆ける", "사랑", "Москва", "♥", "🎵", "AC/DC", "What?", "<Live>", 'The "Best"',
+    "Part 1: Intro", "feat. Someone", "Remix*", "100%", "#1", "[Remastered]", "Mr. Blue",
+]
+
+
+def legacy_fix_file_name(file_name: Path, replacement: str = "_") -> Path:
+    """
+    The sanitizer file names used to go through, kept here for comparison.
+    """
+    name = file_name.stem
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    invalid_chars: str = r'<>:"/\|?*.#@ºª!$%¨¬´`{}^~[]'
+    invalid_chars += "".join(chr(i) for i in range(32))
+    invalid_chars += "\x7f"
+    for char in invalid_chars:
+        name = name.replace(char, replacement)
+    name = name.strip("")
+    name = re.sub(f"[{re.escape(replacement)}]+", replacement, name)
+    max_length = 255
+    if len(name) > max_length:
+        name = name[: max_length - len(file_name.suffix)]
+    return Path(f"{name}{file_name.suffix}")
+
+
+def make_titles(count: int, duplicates: float, seed: int) -> list[str]:
+    """
+    Builds `count` "artist - title" names, about `duplicates` of them repeated.
+    """
+    rng = random.Random(seed)
+    titles: list[str] = []
+    for _ in range(count):
+        if len(titles) > 0 and rng.random() < duplicates:
+            titles.append(rng.choice(titles))
+            continue
+        artist = " ".join(rng.choices(WORDS, k=rng.randint(1, 2)))
+        title = " ".join(rng.choices(WORDS, k=rng.randint(1, 5)))
+        titles.append(f"{artist} - {title} {rng.randint(0, 999)}")
+    return titles
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--titles", type=int, default=100_000)
+    parser.add_argument("--duplicates", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    titles = make_titles(args.titles, args.duplicates, args.seed)
+
+    start = time.perf_counter()
+    legacy = [legacy_fix_file_name(Path(f"{title}.mp3")) for title in titles]
+    legacy_seconds = time.perf_counter() - start
+    legacy_collisions = len(legacy) - len({str(path).casefold() for path in legacy})
+
+    start = time.perf_counter()
+    allocator = FileNameAllocator(".mp3")
+    allocated = [allocator.allocate(title) for title in titles]
+    allocator_seconds = time.perf_counter() - start
+    allocator_collisions = len(allocated) - len({name.casefold() for name in allocated})
+
+    for name, seconds, collisions in (
+        ("legacy", legacy_seconds, legacy_collisions),
+        ("allocator", allocator_seconds, allocator_collisions),
+    ):
+        print(
+            f"{name:10} {seconds:7.3f}s  {seconds / len(titles) * 1e6:6.2f} us/title  "
+            f"{collisions} colliding names"
+        )
+    print(f"speedup    {legacy_seconds / allocator_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
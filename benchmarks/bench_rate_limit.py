@@ -0,0 +1,109 @@
+"""
+Exercises `RateLimiter` against a local HTTP server that throttles.
+
+The server answers 429 whenever more than `--server-concurrency` requests are in flight,
+the way YouTube starts refusing a client that opens too many streams. Workers fetch
+through the limiter, backing off and shrinking concurrency on each 429, and the run
+reports sustained throughput and how often the server refused. Run from the repository
+root:
+
+    python benchmarks/bench_rate_limit.py --workers 16 --server-concurrency 4
+"""
+
+import sys, time, argparse, threading, http.server, urllib.request, urllib.error
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from logic.rate_limit import RateLimiter, is_throttled
+
+PAYLOAD = b"\x00" * 64 * 1024
+
+
+class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves a fixed payload slowly, or 429 when too many requests are in flight.
+    """
+
+    active = 0
+    limit = 4
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with ThrottlingHandler.lock:
+            throttled = ThrottlingHandler.active >= ThrottlingHandler.limit
+            if not throttled:
+                ThrottlingHandler.active += 1
+        if throttled:
+            self.send_response(429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            time.sleep(0.05)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+            self.end_headers()
+            self.wfile.write(PAYLOAD)
+        finally:
+            with ThrottlingHandler.lock:
+                ThrottlingHandler.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def worker(limiter: RateLimiter, url: str, deadline: float, counts: dict[str, int]):
+    """
+    Fetches the url through the limiter until the deadline, counting outcomes.
+    """
+    while time.monotonic() < deadline:
+        try:
+            with limiter.slot():
+                with urllib.request.urlopen(url) as response:
+                    data = response.read()
+            limiter.consume_bytes(len(data))
+            limiter.succeeded()
+            counts["ok"] += 1
+        except urllib.error.HTTPError as e:
+            if not is_throttled(e):
+                raise
+            limiter.throttled()
+            counts["throttled"] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--server-concurrency", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--requests-per-second", type=float, default=0)
+    args = parser.parse_args()
+
+    ThrottlingHandler.limit = args.server_concurrency
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/track"
+
+    limiter = RateLimiter(
+        args.requests_per_second, 0, args.workers, backoff_base=0.1, backoff_max=2
+    )
+    counts = {"ok": 0, "throttled": 0}
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=worker, args=(limiter, url, deadline, counts))
+        for _ in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    print(f"ok:          {counts['ok'] / args.seconds:8.1f} req/s")
+    print(f"throttled:   {counts['throttled']:8d}")
+    print(f"final limit: {limiter.concurrency.limit:8d} of {args.workers}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Measures startup time and which heavy dependencies a run loads.
+
+Each measurement runs in a fresh interpreter, so import costs are paid every time:
+
+- "import app" only imports the application module.
+- "nothing to do" runs the whole application in a scratch folder whose playlist cache
+  is fresh and whose tracks are all done, the usual cron run. It needs no network and
+  should not import yt_dlp, ytmusicapi or mutagen at all.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --tracks 2000 --repeat 5
+"""
+
+import sys, os, json, time, argparse, statistics, subprocess, tempfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+HEAVY_MODULES = ["yt_dlp", "ytmusicapi", "mutagen"]
+PLAYLIST_ID = "PLbenchstartup"
+
+IMPORT_APP = f"""
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {str(SRC)!r})
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+RUN_APP = f"""
+import sys, time, json, logging
+start = time.perf_counter()
+sys.path.insert(0, {str(SRC)!r})
+from app import App
+try:
+    App(logging.WARNING).run()
+except SystemExit as error:
+    # The application always exits, only a non zero code is a failed run.
+    if error.code not in (None, 0):
+        raise
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def prepare_library(folder: Path, track_count: int) -> None:
+    """
+    Lays out a library where every track of a freshly cached playlist is already done.
+    """
+    import utils
+    from config import Config
+    from data.mp3 import Mp3
+    from data.state import State
+    from logic.playlist import CACHE_VERSION
+
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        Config.PLAYLIST_URL_FILE_PATH.write_text(
+            f"https://music.youtube.com/playlist?list={PLAYLIST_ID}\n", encoding="utf-8"
+        )
+        Config.DOWNLOAD_FOLDER_PATH.mkdir(parents=True)
+        state = State()
+        state.playlist_url_ids = [PLAYLIST_ID]
+        tracks = []
+        for i in range(track_count):
+            mp3 = Mp3(f"video{i:07d}", f"Title {i}")
+            mp3.artist = f"Artist {i % 100}"
+            mp3.file_path = Config.DOWNLOAD_FOLDER_PATH / f"Artist {i % 100} - Title {i}.mp3"
+            mp3.file_path.touch()
+            mp3.state = Mp3.State.DONE
+            state.add(mp3)
+            tracks.append(
+                {
+                    "id": mp3.url_id,
+                    "title": mp3.title,
+                    "artist": mp3.artist,
+                    "album": "",
+                    "duration": 0,
+                    "thumbnail": "",
+                }
+            )
+        utils.write_json_file(Config.CONTROL_FILE_PATH, state.to_json())
+        utils.write_json_file(
+            Config.PLAYLISTS_CACHE_FOLDER_PATH / f"{PLAYLIST_ID}.json",
+            {"version": CACHE_VERSION, "id": PLAYLIST_ID, "fetched_at": time.time(), "tracks": tracks},
+            indent=None,
+        )
+    finally:
+        os.chdir(cwd)
+
+
+def measure(code: str, folder: Path, repeat: int) -> tuple[list[float], list[str]]:
+    """
+    Runs the code in fresh interpreters, returning the times and the heavy modules loaded.
+    Exits with the output of the run if one of them fails.
+    """
+    times: list[float] = []
+    loaded: list[str] = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-c", code], cwd=folder, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            sys.exit(
+                f"Measured run failed with exit code {process.returncode}:\n"
+                f"{process.stdout}{process.stderr}"
+            )
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded = result["loaded"]
+    return times, loaded
+
+
+def report(name: str, times: list[float], loaded: list[str]) -> None:
+    print(
+        f"{name:14} median {statistics.median(times) * 1000:8.1f} ms   "
+        f"min {min(times) * 1000:8.1f} ms   "
+        f"heavy modules loaded: {', '.join(loaded) if loaded else 'none'}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp:
+        folder = Path(temp)
+        prepare_library(folder, args.tracks)
+        report("import app", *measure(IMPORT_APP, folder, args.repeat))
+        report("nothing to do", *measure(RUN_APP, folder, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Memory and time of loading and saving a large state, per control file format.
+
+A synthetic library of `--tracks` finished tracks is written once in each format, then
+every format is measured in a fresh interpreter (writing the files in one too, as a
+child process inherits the peak RSS of its parent):
+
+- "json" is the single document control file, built as a whole by `State.to_json` and
+  parsed as a whole by `State.from_json`.
+- "jsonl" is the JSON lines control file, written and read one track at a time by
+  `State.write_jsonl` and `State.read_jsonl`.
+
+Reported are the file size, load and save times, the RSS growth while loading (what the
+loaded state and the parsing leave behind) and the peak RSS of the process, plus the
+size of a single `Mp3` object. Run from the repository root:
+
+    python benchmarks/bench_state.py --tracks 100000
+"""
+
+import sys, json, time, argparse, resource, tempfile, subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+FORMATS = {"json": "control.json", "jsonl": "control.jsonl"}
+
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of the process right now, from /proc on Linux.
+    """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the process.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def make_state(track_count: int):
+    """
+    Builds a state of finished tracks, with album and artist names shared like in a
+    real library.
+    """
+    from data.mp3 import Mp3
+    from data.state import State
+
+    state = State()
+    state._playlist_url_ids = ["PLbenchstate"]
+    for i in range(track_count):
+        mp3 = Mp3(f"v{i:09d}", f"Track number {i}")
+        mp3.artist = f"Artist {i % 500}"
+        mp3.album = f"Album {i % 2000}"
+        mp3.thumbnail_url = f"https://lh3.googleusercontent.com/thumb{i % 2000}=w544-h544"
+        mp3.file_path = Path("downloads", f"Artist {i % 500} - Track number {i}.mp3")
+        mp3.state = Mp3.State.DONE
+        state.add(mp3)
+    return state
+
+
+def prepare(args: argparse.Namespace) -> None:
+    """
+    Writes the synthetic state in every format.
+    """
+    import utils
+
+    state = make_state(args.tracks)
+    folder = Path(args.folder)
+    utils.write_json_file(folder / FORMATS["json"], state.to_json(), indent=None)
+    state.write_jsonl(folder / FORMATS["jsonl"])
+    result = {"mp3_bytes": sys.getsizeof(state.mp3s[0])}
+    Path(args.result).write_text(json.dumps(result), encoding="utf-8")
+
+
+def child(args: argparse.Namespace) -> None:
+    """
+    Loads and saves the state in one format, writing the measurements to the result file.
+    """
+    import utils
+    from data.state import State
+
+    file_path = Path(args.folder, FORMATS[args.phase])
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    if args.phase == "json":
+        state = State.from_json(utils.read_json_file(file_path))
+    else:
+        state = State.read_jsonl(file_path)
+    loaded = time.perf_counter()
+    loaded_rss = current_rss_mb()
+    if args.phase == "json":
+        utils.write_json_file(file_path, state.to_json(), indent=None)
+    else:
+        state.write_jsonl(file_path)
+    saved = time.perf_counter()
+    result = {
+        "tracks": len(state.mp3s),
+        "load": loaded - start,
+        "save": saved - loaded,
+        "load_rss_mb": loaded_rss - baseline,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    Path(args.result).write_text(json.dumps(result), encoding="utf-8")
+
+
+def run_child(phase: str, args: argparse.Namespace, folder: Path) -> dict:
+    """
+    Runs a phase in a fresh interpreter and returns its measurements.
+    """
+    result_path = folder / f"{phase}.result.json"
+    command = [sys.executable, str(Path(__file__).resolve()), "--child"]
+    command += ["--phase", phase, "--folder", str(folder), "--result", str(result_path)]
+    command += ["--tracks", str(args.tracks)]
+    subprocess.run(command, check=True)
+    return json.loads(result_path.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--phase", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        if args.phase == "prepare":
+            prepare(args)
+        else:
+            child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as temp:
+        folder = Path(temp)
+        prepared = run_child("prepare", args, folder)
+        print(
+            f"{args.tracks} tracks, {prepared['mp3_bytes']} bytes per Mp3 object before "
+            "its fields"
+        )
+        for name, file_name in FORMATS.items():
+            result = run_child(name, args, folder)
+            size_mb = (folder / file_name).stat().st_size / (1024 * 1024)
+            print(
+                f"{name:6} {size_mb:7.1f} MB on disk  load {result['load']:6.3f}s  "
+                f"save {result['save']:6.3f}s  loaded +{result['load_rss_mb']:6.1f} MB  "
+                f"peak RSS {result['peak_rss_mb']:7.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
-import sys, logging, utils
+import sys, logging, threading, heapq, time, random, signal, itertools, utils
 from collections import deque
 from pathlib import Path
-from logic import update_tags
 from data.state import State
+from data.journal import Journal
+from data.sqlite_state import SqliteState
 from data.mp3 import Mp3
 import logic.playlist as playlist
 import logic.downloads as downloads
+import logic.transcode as transcode
 import logic.update_tags as update_tags
 import logic.progress_bar as progress_bar
+import logic.playlist_links as playlist_links
+import logic.reconcile as reconcile
+import logic.content_index as content_index
+from logic.album_art import AlbumArtCache
+from logic.file_names import FileNameAllocator
+from logic.metrics import Metrics
+from logic.pipeline import Pipeline, Stage
+from logic.rate_limit import RateLimiter
+from logic.retry import RetryScheduler
 from constants import AppMeta
 from config import Config
 
@@ -24,25 +35,74 @@ class App:
         self,
         console_log_level: int = logging.INFO,
         file_log_level: int = logging.WARNING,
+        force_refresh: bool = False,
+        retry_failed: bool = False,
     ):
         """
         Initializes the application.
 
         Args:
-            playlist_url (str): The URL of the YouTube playlist to download.
             console_log_level (int): The logging level for console output.
             file_log_level (int): The logging level for file output.
+            force_refresh (bool): Whether to fetch the playlists even if their cache is fresh.
+            retry_failed (bool): Whether to retry the failed files right away, including the
+                ones given up on.
         """
+        self._force_refresh = force_refresh
+        self._retry_failed = retry_failed
+        self._metrics = Metrics(AppMeta.NAME.lower())
+        self._progress = progress_bar.TransferProgress(
+            refresh_rate=Config.PROGRESS_REFRESH_RATE,
+            max_fetch_lines=Config.DOWNLOAD_WORKERS,
+        )
         self._setup_logger(console_log_level, file_log_level)
-        self._progress_bar = progress_bar.ProgressBar(total=1000)
-        self._setup_state()
-        playlist_url_id = self._load_playlist_id()
-        # Check if id change from previous run and remove json file to redownload.
-        if playlist_url_id != self._state.playlist_url_id:
-            self._state.playlist_url_id = playlist_url_id
-            Config.PLAYLIST_JSON_PATH.unlink(missing_ok=True)
-        self._remove_missing_files()
         self._process_queue: deque[Mp3] = deque()
+        # Url ids of the tracks in each playlist, filled by _extract_playlist.
+        self._playlist_tracks: dict[str, list[str]] = {}
+        # Started by _enqueue when the first file needs processing.
+        self._pipeline: Pipeline | None = None
+        # Failed tracks waiting for their next attempt, ordered by when it is due.
+        self._retry = RetryScheduler(
+            Config.RETRY_BASE_DELAY, Config.RETRY_MAX_DELAY, Config.RETRY_MAX_ATTEMPTS
+        )
+        self._retries: list[tuple[float, str, Mp3]] = []
+        self._retries_lock = threading.Lock()
+        # Shared by every request to YouTube, playlist fetches and downloads alike.
+        self._limiter = RateLimiter(
+            Config.RATE_LIMIT_REQUESTS_PER_SECOND,
+            Config.RATE_LIMIT_BYTES_PER_SECOND,
+            Config.DOWNLOAD_WORKERS,
+        )
+        # One download session per download worker, reused across tracks.
+        self._downloaders = threading.local()
+        self._all_downloaders: list[downloads.Downloader] = []
+        self._downloaders_lock = threading.Lock()
+        # Kept for the whole run, so every poll of watch mode reuses its session.
+        self._playlist_client = playlist.Client()
+        # Built on first use, see `_file_names`. Names are casefolded, like the allocator
+        # compares them.
+        self._file_name_allocator: FileNameAllocator | None = None
+        self._claimed_names: set[str] = set()
+        # Held while a file path is assigned, transcode workers assign them too.
+        self._file_names_lock = threading.Lock()
+        # Built on first use, see `_contents`.
+        self._content_index: content_index.ContentIndex | None = None
+        self._content_index_lock = threading.Lock()
+        self._linked_duplicates: int = 0
+        self._album_art: AlbumArtCache | None = None
+        if Config.ALBUM_ART:
+            self._album_art = AlbumArtCache(
+                self._logger,
+                Config.ALBUM_ART_FOLDER_PATH,
+                Config.ALBUM_ART_CACHE_BYTES,
+                Config.ALBUM_ART_SIZE,
+                Config.FFMPEG_PATH,
+            )
+        with self._metrics.measure("startup"):
+            self._setup_state()
+            self._update_playlist_ids()
+            self._reconcile_files()
+            self._queue_pending_work()
 
     def _setup_logger(self, console_log_level, file_log_level):
         """
@@ -54,7 +114,16 @@ class App:
         """
         try:
             self._logger = utils.setup_logger(
-                AppMeta.NAME, Config.LOG_FILE_PATH, file_log_level, console_log_level
+                AppMeta.NAME,
+                Config.LOG_FILE_PATH,
+                file_log_level,
+                console_log_level,
+                max_bytes=Config.LOG_MAX_BYTES,
+                backup_count=Config.LOG_BACKUP_COUNT,
+                json_lines=Config.LOG_JSON,
+                queued=Config.LOG_QUEUED,
+                # Log lines are printed above the progress instead of over it.
+                console_stream=self._progress,  # type: ignore
             )
         except Exception as e:
             print(f"Failed to set up logger: '{e}'. Exiting.")
@@ -62,101 +131,496 @@ class App:
 
     def _setup_state(self):
         """
-        Loads the application state from the control file, or creates a new state if not found.
-        """
-        if Config.CONTROL_FILE_PATH.exists():
-            try:
-                self._state = self._load_state()
-                self._logger.debug(f"Loaded state from '{Config.CONTROL_FILE_PATH}'")
-                # add pending work to the queue
-                for mp3 in self._state.mp3s:
-                    if mp3.state is not Mp3.State.DONE:
-                        self._process_queue.append(mp3)
-            except Exception as e:
-                self._logger.error(
-                    f"Failed to load state from '{Config.CONTROL_FILE_PATH}': '{e}'. Exiting."
+        Loads the application state from the control file and replays the journal written
+        since, or creates a new state if neither is found. Every later change is appended
+        to the journal. With the sqlite backend the database is opened instead.
+        """
+        if Config.STATE_BACKEND == "sqlite":
+            self._setup_sqlite_state()
+            return
+        journal = Journal(
+            Config.JOURNAL_FILE_PATH, Config.JOURNAL_COMPACT_EVERY, Config.JOURNAL_FSYNC
+        )
+        checkpoint_path = self._control_file_paths()[0]
+        try:
+            control_file_path = self._existing_control_file()
+            if control_file_path is not None:
+                self._state = self._load_state(control_file_path)
+                self._logger.debug("Loaded state from '%s'", control_file_path)
+            else:
+                self._state = State()
+            replayed = self._state.replay(journal)
+            if replayed > 0:
+                self._logger.debug(
+                    "Replayed %d changes from '%s'", replayed, Config.JOURNAL_FILE_PATH
                 )
-                self._quit(1)
-        else:
-            self._state = State()
+        except Exception as e:
+            self._logger.error("Failed to load state: '%s'. Exiting.", e)
+            self._quit(1)
+        journal.open()
+        journal.pending = replayed
+        self._state.attach_journal(
+            journal, checkpoint_path, lines=checkpoint_path.suffix == ".jsonl"
+        )
+
+    def _setup_sqlite_state(self):
+        """
+        Opens the state database, importing the control file on first use.
+        """
+        try:
+            state = SqliteState(Config.STATE_DB_FILE_PATH)
+            control_file_path = self._existing_control_file()
+            if state.is_empty() and control_file_path is not None:
+                json_state = self._load_state(control_file_path)
+                json_state.replay(
+                    Journal(Config.JOURNAL_FILE_PATH, Config.JOURNAL_COMPACT_EVERY)
+                )
+                state.import_state(json_state)
+                self._logger.debug(
+                    "Imported state from '%s' into '%s'",
+                    control_file_path,
+                    Config.STATE_DB_FILE_PATH,
+                )
+            self._state: State | SqliteState = state
+            self._logger.debug("Opened state database '%s'", Config.STATE_DB_FILE_PATH)
+        except Exception as e:
+            self._logger.error(
+                "Failed to open state database '%s': '%s'. Exiting.",
+                Config.STATE_DB_FILE_PATH,
+                e,
+            )
+            self._quit(1)
 
-    def _load_playlist_id(self) -> str:
+    def _queue_pending_work(self):
         """
-        Loads the playlist ID from the URL specified in the playlist URL file.
+        Adds the mp3s left unfinished by a previous run to the work queue. Failed ones are
+        kept aside to be retried behind fresh work, once their backoff is over, or right
+        away when retrying failed files was asked for.
+        """
+        given_up = 0
+        for mp3 in self._state.pending():
+            if mp3.state is not Mp3.State.FAILED:
+                self._reset_lost_fetch(mp3)
+                self._process_queue.append(mp3)
+                continue
+            if self._retry_failed:
+                self._retry.reset(mp3)
+                self._state.update(mp3)
+            if not self._retry.gave_up(mp3):
+                self._schedule_retry(mp3)
+            else:
+                given_up += 1
+        if given_up > 0:
+            self._logger.warning(
+                "%d files failed %d times and are not retried anymore, run with "
+                "--retry-failed to try them again.",
+                given_up,
+                Config.RETRY_MAX_ATTEMPTS,
+            )
 
-        Reads the playlist URL from the file defined in `Config.PLAYLIST_URL_FILE_PATH`,
-        extracts the playlist ID from the URL, and returns it.
+    def _reset_lost_fetch(self, mp3: Mp3) -> None:
+        """
+        Sends a fetched mp3 back to be fetched again if its file left the temporary folder,
+        and forgets the partial fetch of an mp3 whose .part file is gone.
 
+        Args:
+            mp3 (Mp3): The Mp3 object about to be processed.
+        """
+        if mp3.state is Mp3.State.FETCHED and (
+            mp3.temp_path is None or not mp3.temp_path.exists()
+        ):
+            mp3.state = Mp3.State.CREATED
+            mp3.temp_path = None
+            mp3.fetched_bytes = 0
+            self._state.update(mp3)
+        elif mp3.state is Mp3.State.CREATED and mp3.fetched_bytes > 0:
+            if any(Config.RAW_FOLDER_PATH.glob(f"{mp3.url_id}.*.part")):
+                self._logger.debug(
+                    "Resuming fetch of %s from %d bytes", mp3.url_id, mp3.fetched_bytes
+                )
+            else:
+                mp3.fetched_bytes = 0
+                self._state.update(mp3)
+
+    def _schedule_retry(self, mp3: Mp3) -> None:
+        """
+        Keeps a failed mp3 aside until its next attempt is due.
+
+        Args:
+            mp3 (Mp3): The failed Mp3 object.
+        """
+        with self._retries_lock:
+            heapq.heappush(self._retries, (mp3.next_attempt_at, mp3.url_id, mp3))
+
+    def _submit_due_retries(self) -> None:
+        """
+        Hands the failed mp3s whose backoff is over back to the pipeline.
+        """
+        now = time.time()
+        due: list[Mp3] = []
+        with self._retries_lock:
+            while len(self._retries) > 0 and self._retry.is_due(self._retries[0][2], now):
+                due.append(heapq.heappop(self._retries)[2])
+        for mp3 in due:
+            self._logger.debug(
+                "Retrying %s, attempt %d: %s", mp3.url_id, mp3.attempts + 1, mp3.last_error
+            )
+            self._retry.resume(mp3)
+            self._reset_lost_fetch(mp3)
+            self._state.update(mp3)
+            self._enqueue(mp3)
+
+    def _next_retry_wait(self) -> float | None:
+        """
         Returns:
-            str: The ID of the YouTube playlist.
+            float | None: Seconds until the next failed mp3 is due, None if there is none.
         """
+        with self._retries_lock:
+            if len(self._retries) == 0:
+                return None
+            return max(0.0, self._retries[0][0] - time.time())
+
+    def _update_playlist_ids(self) -> None:
+        """
+        Stores the playlist IDs of the playlist URL file in the state, if they changed.
+        """
+        playlist_url_ids = self._load_playlist_ids()
+        if playlist_url_ids != self._state.playlist_url_ids:
+            self._state.playlist_url_ids = playlist_url_ids
+
+    def _load_playlist_ids(self) -> list[str]:
+        """
+        Loads the playlist IDs from the URLs specified in the playlist URL file.
+
+        Reads the file defined in `Config.PLAYLIST_URL_FILE_PATH`, one URL per line,
+        skipping blank lines and lines starting with #, and extracts each playlist ID.
+
+        Returns:
+            list[str]: The IDs of the YouTube playlists, without duplicates.
+        """
+        playlist_url_ids: list[str] = []
         with Config.PLAYLIST_URL_FILE_PATH.open("r", encoding="utf-8") as file:
-            playlist_url = file.read().strip()
-        playlist_url_id = utils.grab_id_from_url(playlist_url)
-        return playlist_url_id
-
-    def _remove_missing_files(self):
-        """
-        Removes entries for downloaded files that are no longer present in the filesystem.
-        """
-        i = len(self._state.mp3s)
-        while i > 0:
-            i -= 1
-            mp3 = self._state.mp3s[i]
-            if mp3.state in (Mp3.State.DOWNLOADED, Mp3.State.DONE):
-                assert mp3.file_path is not None
-                if not mp3.file_path.exists():
-                    self._state.remove(mp3)
-                    self._logger.debug(
-                        f"Removed control entry for missing file '{mp3.file_path.name}'"
-                    )
+            for line in file:
+                playlist_url = line.strip()
+                if len(playlist_url) == 0 or playlist_url.startswith("#"):
+                    continue
+                playlist_url_id = utils.grab_id_from_url(playlist_url)
+                if playlist_url_id not in playlist_url_ids:
+                    playlist_url_ids.append(playlist_url_id)
+        return playlist_url_ids
+
+    def _reconcile_files(self):
+        """
+        Scans the download folder once and removes, in bulk, the entries for downloaded
+        files that are no longer present in it. The scan is kept to adopt files that are
+        on disk but unknown to the state, see `_assign_file_path`.
+        """
+        self._disk_index = reconcile.scan_folder(Config.DOWNLOAD_FOLDER_PATH)
+        download_folder = Config.DOWNLOAD_FOLDER_PATH
+        missing: list[Mp3] = []
+        for mp3 in self._state.with_files():
+            assert mp3.file_path is not None
+            if mp3.file_path.parent == download_folder:
+                found = mp3.file_path.name in self._disk_index
+            else:
+                found = mp3.file_path.exists()
+            if not found:
+                missing.append(mp3)
+        self._state.remove_many(missing)
+        self._logger.debug(
+            "Scanned %d files in '%s', removed %d control entries for missing files",
+            len(self._disk_index),
+            download_folder,
+            len(missing),
+        )
 
-    def run(self):
+    def _file_names(self) -> FileNameAllocator:
         """
-        Runs the main application logic.
+        Returns the allocator of file names in the download folder, creating it on first
+        use from the files on disk and the names the state already holds. Called with
+        `_file_names_lock` held.
+
+        Returns:
+            FileNameAllocator: The allocator.
+        """
+        if self._file_name_allocator is None:
+            self._claimed_names = {
+                mp3.file_path.name.casefold()
+                for mp3 in itertools.chain(self._state.with_files(), self._state.pending())
+                if mp3.file_path is not None
+            }
+            self._file_name_allocator = FileNameAllocator(
+                f".{Config.AUDIO_FORMAT}",
+                itertools.chain(self._disk_index, self._claimed_names),
+            )
+        return self._file_name_allocator
+
+    def _contents(self) -> content_index.ContentIndex:
+        """
+        Returns the index of the finished files by the hash of their audio, creating it
+        on first use from the state. The index holds every finished track, so with the
+        sqlite backend they all end up loaded in memory.
+
+        Returns:
+            content_index.ContentIndex: The index.
+        """
+        with self._content_index_lock:
+            if self._content_index is None:
+                index = content_index.ContentIndex(Config.DEDUPLICATE_DURATION_TOLERANCE)
+                for mp3 in self._state.with_files():
+                    if mp3.state is Mp3.State.DONE and mp3.content_hash is not None:
+                        index.add(mp3)
+                self._content_index = index
+            return self._content_index
+
+    def _deduplicate(self, mp3: Mp3) -> None:
         """
+        Hashes the audio of a finished file and, when an earlier file holds the same
+        recording, replaces it with a hardlink to that one.
+
+        Args:
+            mp3 (Mp3): The Mp3 object whose file was just finished.
+        """
+        if not Config.DEDUPLICATE:
+            return
+        assert mp3.file_path is not None
         try:
-            self._progress_bar.update(0, prefix="Extracting playlist")
-            self._logger.debug(
-                f"Starting application with playlist URL: {self._state.playlist_url_id}"
+            with self._metrics.measure("hash") as measurement:
+                mp3.content_hash = content_index.audio_hash(
+                    mp3.file_path, Config.FFMPEG_PATH
+                )
+                measurement.bytes = mp3.file_path.stat().st_size
+        except Exception as e:
+            self._logger.warning("Could not hash %s: %s", mp3.file_path, e)
+            return
+        original = self._contents().add(mp3)
+        if original is not mp3:
+            self._link_duplicate(original, mp3)
+
+    def _link_known_recording(self, mp3: Mp3) -> bool:
+        """
+        Links a new mp3 to a finished file with the same artist, title and duration,
+        when `Config.DEDUPLICATE_BY_METADATA` is on, instead of downloading it.
+
+        Args:
+            mp3 (Mp3): The new Mp3 object, with its file path assigned.
+
+        Returns:
+            bool: True when the mp3 was linked and is done.
+        """
+        if not (Config.DEDUPLICATE and Config.DEDUPLICATE_BY_METADATA):
+            return False
+        if mp3.state is not Mp3.State.CREATED:
+            return False
+        original = self._contents().find_same_track(mp3)
+        if original is None or not self._link_duplicate(original, mp3):
+            return False
+        mp3.content_hash = original.content_hash
+        mp3.state = Mp3.State.DONE
+        return True
+
+    def _link_duplicate(self, original: Mp3, mp3: Mp3) -> bool:
+        """
+        Makes the file of an mp3 a hardlink to the file of another one holding the same
+        recording. The file of the mp3 is left as it is when linking fails.
+
+        Args:
+            original (Mp3): The Mp3 object whose file is kept.
+            mp3 (Mp3): The Mp3 object whose file is replaced.
+
+        Returns:
+            bool: True when the file was linked.
+        """
+        assert original.file_path is not None and mp3.file_path is not None
+        try:
+            utils.replace_with_hardlink(original.file_path, mp3.file_path)
+        except OSError as e:
+            self._logger.warning(
+                "Could not link %s to %s: %s", mp3.file_path, original.file_path, e
             )
-            self._extract_playlist()
+            return False
+        stat = mp3.file_path.stat()
+        self._disk_index[mp3.file_path.name] = reconcile.FileEntry(stat.st_size, stat.st_mtime)
+        with self._content_index_lock:
+            self._linked_duplicates += 1
+        self._logger.debug(
+            "Linked %s to %s, the same recording as %s",
+            mp3.url_id,
+            original.file_path,
+            original.url_id,
+        )
+        return True
 
-            if len(self._process_queue) > 0:
-                self._progress_bar.update(100, prefix="Downloading files")
-                self._process_files()
+    def _assign_file_path(self, mp3: Mp3) -> None:
+        """
+        Picks the file in the download folder an mp3 is saved to, named after
+        `Config.FILE_NAME_TEMPLATE` and suffixed when another track already uses the name.
 
-                self._logger.debug("All files processed successfully.")
-            else:
-                self._logger.debug("No files to process.")
+        A file already in the download folder under the name a new mp3 would get, and
+        that no other entry owns, is adopted instead of downloading it again. Names are
+        tried in the order the allocator hands them out, so files suffixed by an earlier
+        run are adopted too when the state was lost. Their tags are still rewritten.
 
-            self._progress_bar.done("Done")
+        Args:
+            mp3 (Mp3): The Mp3 object to name.
+        """
+        name = Config.FILE_NAME_TEMPLATE.format(
+            artist=mp3.artist,
+            title=mp3.title,
+            album=mp3.album if mp3.album is not None else "",
+        )
+        with self._file_names_lock:
+            file_names = self._file_names()
+            adopt = False
+            if mp3.state is Mp3.State.CREATED:
+                # The first name no entry owns is the one an earlier run gave this track.
+                for file_name in file_names.candidates(name):
+                    if file_name.casefold() not in self._claimed_names:
+                        adopt = file_name in self._disk_index
+                        break
+            if not adopt:
+                file_name = file_names.allocate(name)
+            self._claimed_names.add(file_name.casefold())
+        mp3.file_path = Config.DOWNLOAD_FOLDER_PATH / file_name
+        if adopt:
+            mp3.state = Mp3.State.DOWNLOADED
+            self._logger.debug("Adopted existing file '%s' for %s", file_name, mp3.url_id)
 
+    def run(self):
+        """
+        Runs the main application logic once, then exits.
+        """
+        try:
+            self._poll()
         except Exception as e:
-            self._logger.error(f"An error occurred: {e}")
+            self._logger.error("An error occurred: %s", e)
             self._quit(1)
 
         self._quit(0)
 
-    def _load_state(self) -> State:
+    def watch(self, interval: float | None = None) -> None:
         """
-        Loads the application state from the control file.
+        Runs the application as a daemon, polling the playlists until interrupted by
+        Ctrl+C or SIGTERM, then exits.
+
+        The state, the disk index, the playlist client, the pipeline and the download
+        sessions of its workers stay in memory between polls, so a poll only fetches the
+        playlists and processes the songs they gained. The playlist URL file is read
+        again before each poll. A failed poll is logged and tried again at the next one.
+
+        Args:
+            interval (float | None): Seconds between polls, `Config.WATCH_INTERVAL` when
+                None. Each wait is moved at random by up to `Config.WATCH_JITTER` of it.
+        """
+        interval = Config.WATCH_INTERVAL if interval is None else interval
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            while True:
+                try:
+                    with self._metrics.measure("poll"):
+                        self._update_playlist_ids()
+                        self._poll(keep_pipeline=True)
+                except Exception as e:
+                    self._progress.stop("Poll failed")
+                    self._logger.error("Poll failed, trying again at the next one: %s", e)
+                self._write_metrics(0)
+                # The interval replaces the cache lifetime, later polls always fetch.
+                self._force_refresh = True
+                jitter = random.uniform(-Config.WATCH_JITTER, Config.WATCH_JITTER)
+                wait = interval * (1 + jitter)
+                self._logger.debug("Next poll in %.0fs", wait)
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            self._logger.debug("Stopped watching the playlists.")
+        self._quit(0)
+
+    def _terminate(self, signum, frame) -> None:
+        """
+        Handles SIGTERM like Ctrl+C, so a service manager stops watch mode cleanly.
+        """
+        raise KeyboardInterrupt()
+
+    def _poll(self, keep_pipeline: bool = False) -> None:
+        """
+        Extracts the playlists and processes every file that is not done yet.
+
+        Args:
+            keep_pipeline (bool): Whether to keep the pipeline and its download sessions
+                running once the files are processed, for the next poll.
+        """
+        self._progress.start("Extracting playlist")
+        self._logger.debug(
+            "Starting application with playlist URLs: %s", self._state.playlist_url_ids
+        )
+        # Work left by the previous run goes first.
+        while len(self._process_queue) > 0:
+            self._enqueue(self._process_queue.popleft())
+        self._playlist_tracks.clear()
+        self._extract_playlist()
+        # Failed files from earlier runs go behind the fresh ones.
+        self._submit_due_retries()
+
+        if self._pipeline is not None:
+            self._process_files(keep_pipeline)
+
+            self._logger.debug("All files processed successfully.")
+        else:
+            self._logger.debug("No files to process.")
+
+        if len(self._playlist_tracks) > 1:
+            self._link_playlists()
+
+        self._progress.stop("Done")
+
+    def _control_file_paths(self) -> list[Path]:
+        """
+        Returns:
+            list[Path]: The control files the state can be loaded from, the one written by
+                the configured backend first.
+        """
+        if Config.STATE_BACKEND == "json":
+            return [Config.CONTROL_FILE_PATH, Config.CONTROL_LINES_FILE_PATH]
+        return [Config.CONTROL_LINES_FILE_PATH, Config.CONTROL_FILE_PATH]
+
+    def _existing_control_file(self) -> Path | None:
+        """
+        Returns:
+            Path | None: The first control file that exists, None if there is none.
+        """
+        for file_path in self._control_file_paths():
+            if file_path.exists():
+                return file_path
+        return None
+
+    def _load_state(self, file_path: Path) -> State:
+        """
+        Loads the application state from a control file, in either format.
+
+        Args:
+            file_path (Path): The control file.
 
         Returns:
             State: The application state.
         """
-        json_data = utils.read_json_file(Config.CONTROL_FILE_PATH)
+        if file_path.suffix == ".jsonl":
+            return State.read_jsonl(file_path)
+        json_data = utils.read_json_file(file_path)
         return State.from_json(json_data)
 
-    def _save_state(self, state: State) -> None:
+    def _save_state(self, state: State | SqliteState) -> None:
         """
-        Saves the application state to the control file.
+        Saves the application state: to its control file, emptying the journal, or, with
+        the SQLite backend, by checkpointing the write-ahead log into the database.
 
         Args:
-            state (State): The application state to save.
+            state (State | SqliteState): The application state to save.
         """
-        utils.write_json_file(Config.CONTROL_FILE_PATH, state.to_json())
-        self._logger.debug(f"State saved to {Config.CONTROL_FILE_PATH}")
+        state.checkpoint()
+        if isinstance(state, SqliteState):
+            saved_to = state.file_path
+        else:
+            saved_to = self._control_file_paths()[0]
+        self._logger.debug("State saved to %s", saved_to)
 
     def _quit(self, exit_code: int = 0) -> None:
         """
@@ -165,88 +629,370 @@ class App:
         Args:
             exit_code (int): The exit code to use.
         """
-        if hasattr(self, "state"):
+        if hasattr(self, "_progress"):
+            self._progress.stop("Stopped" if exit_code != 0 else "Done")
+        if hasattr(self, "_state"):
             self._save_state(self._state)
             self._logger.debug("Application is exiting, state saved.")
         else:
             self._logger.debug("Application is exiting, no state found, not saving.")
+        self._write_metrics(exit_code)
 
         if exit_code == 0:
-            self._logger.debug(f"Exiting application with code {exit_code}.")
+            self._logger.debug("Exiting application with code %d.", exit_code)
         else:
-            self._logger.warning(f"Exiting application with code {exit_code}.")
+            self._logger.warning("Exiting application with code %d.", exit_code)
         sys.exit(exit_code)
 
+    def _write_metrics(self, exit_code: int) -> None:
+        """
+        Writes the metrics of the run to `Config.METRICS_FILE_PATH` and
+        `Config.METRICS_PROMETHEUS_FILE_PATH`.
+
+        Args:
+            exit_code (int): The exit code of the run.
+        """
+        try:
+            self._metrics.write(
+                Config.METRICS_FILE_PATH, Config.METRICS_PROMETHEUS_FILE_PATH, exit_code
+            )
+        except Exception as e:
+            self._logger.warning("Failed to write metrics: %s", e)
+
     def _extract_playlist(self) -> None:
         """
-        Extracts the playlist information and adds new songs to the state.
+        Extracts the information of every playlist and adds the new songs to the state.
+
+        Songs are handed to the pipeline page by page while the playlists are still being
+        fetched. Songs shared by several playlists are only added, and downloaded, once.
+        """
+        new_count = 0
+        linked_count = 0
+        for playlist_url_id in self._state.playlist_url_ids:
+            url_ids: list[str] = []
+            self._playlist_tracks[playlist_url_id] = url_ids
+            pages = playlist.iter_playlist(
+                playlist_url_id,
+                self._logger,
+                Config.PLAYLISTS_CACHE_FOLDER_PATH / f"{playlist_url_id}.json",
+                Config.PLAYLIST_CACHE_TTL,
+                self._force_refresh,
+                Config.PLAYLIST_PAGE_SIZE,
+                client=self._playlist_client,
+                limiter=self._limiter,
+            )
+            with self._metrics.measure("playlist") as measurement:
+                measurement.items = 0
+                for page in pages:
+                    measurement.items += len(page)
+                    # Waiting for room in the pipeline is not playlist extraction.
+                    with measurement.exclude():
+                        for mp3 in page:
+                            url_ids.append(mp3.url_id)
+                            if mp3.url_id in self._state.by_urls:
+                                continue
+                            self._assign_file_path(mp3)
+                            linked = self._link_known_recording(mp3)
+                            self._state.add(mp3)
+                            if linked:
+                                linked_count += 1
+                                continue
+                            self._enqueue(mp3)
+                            new_count += 1
+        self._logger.debug("Found %d new files to download.", new_count)
+        if linked_count > 0:
+            self._logger.debug("Linked %d new files to ones already downloaded.", linked_count)
+
+    def _link_playlists(self) -> None:
+        """
+        Fills each playlist folder with links to the stored files of its finished songs.
         """
-        new_mp3s = playlist.scrap_playlist(
-            self._state.playlist_url_id, self._logger, Config.PLAYLIST_JSON_PATH
+        for playlist_url_id, url_ids in self._playlist_tracks.items():
+            files: list[Path] = []
+            for url_id in url_ids:
+                mp3 = self._state.by_urls.get(url_id)
+                if mp3 is not None and mp3.state is Mp3.State.DONE:
+                    assert mp3.file_path is not None
+                    files.append(mp3.file_path)
+            playlist_links.sync_playlist_folder(
+                self._logger, Config.PLAYLIST_LINKS_FOLDER_PATH / playlist_url_id, files
+            )
+
+    def _enqueue(self, mp3: Mp3) -> None:
+        """
+        Hands an mp3 to the pipeline, starting the pipeline for the first one.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to process.
+        """
+        if self._pipeline is None:
+            self._pipeline = self._start_pipeline()
+        self._progress.add_file(mp3.state is Mp3.State.CREATED)
+        self._pipeline.submit(mp3)
+
+    def _start_pipeline(self) -> Pipeline:
+        """
+        Starts a pipeline with one stage per state transition, so fetching (network),
+        transcoding (CPU) and tagging (disk) run side by side, each with its own workers.
+        Transcoding writes the tags itself, the tag stage only sees files that were
+        downloaded without them.
+
+        Returns:
+            Pipeline: The started pipeline.
+        """
+        self._progress.set_phase("Downloading files")
+        pipeline = Pipeline(
+            self._logger, on_done=self._file_done, on_failed=self._file_failed
         )
-        by_urls = dict([(mp3.url_id, mp3) for mp3 in new_mp3s])
-        del new_mp3s
+        pipeline.add_stage(
+            Stage(
+                "download",
+                Mp3.State.CREATED,
+                self._download_file,
+                Config.DOWNLOAD_WORKERS,
+                Config.STAGE_QUEUE_SIZE,
+            )
+        )
+        pipeline.add_stage(
+            Stage(
+                "transcode",
+                Mp3.State.FETCHED,
+                self._transcode_file,
+                Config.TRANSCODE_WORKERS,
+                Config.STAGE_QUEUE_SIZE,
+            )
+        )
+        pipeline.add_stage(
+            Stage(
+                "tag",
+                Mp3.State.DOWNLOADED,
+                self._update_tags,
+                Config.TAG_WORKERS,
+                Config.STAGE_QUEUE_SIZE,
+            )
+        )
+        pipeline.start()
+        return pipeline
+
+    def _process_files(self, keep_pipeline: bool = False) -> None:
+        """
+        Waits for the pipeline to finish every queued file, then stops it.
+
+        Files that failed are retried while their backoff ends within
+        `Config.RETRY_WAIT_IN_RUN` seconds, the rest wait for a later run.
 
-        new_urls = by_urls.keys() - self._state.by_urls.keys()
-        for url in new_urls:
-            mp3 = by_urls[url]
-            self._state.add(mp3)
-            self._process_queue.append(mp3)
-        self._logger.debug(f"Found {len(new_urls)} new files to download.")
+        Args:
+            keep_pipeline (bool): Whether to leave the pipeline running, idle.
+        """
+        assert self._pipeline is not None
+        self._progress.set_phase("Downloading files")
+        while True:
+            self._pipeline.join()
+            wait = self._next_retry_wait()
+            if wait is None or wait > Config.RETRY_WAIT_IN_RUN:
+                break
+            time.sleep(wait)
+            self._submit_due_retries()
+        self._logger.debug("Pipeline stats: %s", self._pipeline.describe())
+        if self._album_art is not None:
+            self._logger.debug(
+                "Album art: %d cached, %d fetched", self._album_art.hits, self._album_art.misses
+            )
+        if self._linked_duplicates > 0:
+            self._logger.debug("Linked %d duplicate files", self._linked_duplicates)
+        if keep_pipeline:
+            return
+        self._pipeline.stop()
+        self._pipeline = None
+        self._close_downloaders()
+
+    def _file_done(self, mp3: Mp3) -> None:
+        """
+        Counts an mp3 that left the pipeline as done.
+
+        Args:
+            mp3 (Mp3): The Mp3 object that finished processing.
+        """
+        # Attempts reset by --retry-failed still leave the last error to clear.
+        if mp3.attempts > 0 or len(mp3.last_error) > 0:
+            self._retry.succeeded(mp3)
+            self._state.update(mp3)
+        self._progress.file_done()
 
-    def _process_files(self) -> None:
+    def _file_failed(self, mp3: Mp3, error: Exception) -> None:
         """
-        Processes the files in the work queue, downloading and updating tags as needed.
+        Marks an mp3 as failed and schedules its retry, once a pipeline stage raised.
+
+        Args:
+            mp3 (Mp3): The Mp3 object that failed.
+            error (Exception): The error raised by the stage.
         """
-        progress_left = 900
-        increment = progress_left / len(self._process_queue)
-        actual = 0
-        total = len(self._process_queue)
-        self._progress_bar.update(0, prefix=f"Processing {actual}/{total} files")
-        while len(self._process_queue) > 0:
-            mp3 = self._process_queue[0]
-            match mp3.state:
-                case Mp3.State.CREATED:
-                    self._download_file(mp3)
-                case Mp3.State.DOWNLOADED:
-                    self._update_tags(mp3)
-                case Mp3.State.DONE:
-                    self._process_queue.popleft()
-                    actual += 1
-                    self._progress_bar.update(
-                        increment, prefix=f"Processing {actual}/{total} files"
-                    )
+        self._retry.fail(mp3, error)
+        self._state.update(mp3)
+        if self._retry.gave_up(mp3):
+            self._logger.error(
+                "Giving up on %s after %d attempts: %s", mp3.url_id, mp3.attempts, error
+            )
+        else:
+            self._schedule_retry(mp3)
+        self._progress.file_failed(mp3.url_id, mp3.failed_state is Mp3.State.CREATED)
 
     def _download_file(self, mp3: Mp3) -> None:
         """
-        Downloads a single mp3 file.
+        Fetches the audio of a single file into `Config.RAW_FOLDER_PATH`, unconverted.
 
         Args:
             mp3 (Mp3): The Mp3 object representing the file to download.
         """
-        file_name = Path(
-            Config.FILE_NAME_TEMPLATE.format(
-                artist=mp3.artist,
-                title=mp3.title,
-                album=mp3.album if mp3.album is not None else "",
+        with self._metrics.measure("fetch") as measurement:
+            mp3.temp_path = self._downloader().fetch(
+                mp3.url_id,
+                mp3.url_id,
+                Config.RAW_FOLDER_PATH,
+                lambda downloaded, total: self._fetch_progress(mp3, downloaded, total),
             )
-            + ".mp3"
-        )
-        file_name = utils.fix_file_name(file_name)
-        mp3.file_path = Config.DOWNLOAD_FOLDER_PATH / file_name
+            measurement.bytes = mp3.temp_path.stat().st_size
+        self._progress.fetch_done(mp3.url_id)
+        mp3.fetched_bytes = 0
+        mp3.state = Mp3.State.FETCHED
+        self._state.update(mp3)
 
-        downloads.download_yt_audio(self._logger, mp3.url_id, mp3.file_path)
-        mp3.state = Mp3.State.DOWNLOADED
+    def _fetch_progress(self, mp3: Mp3, downloaded: int, total: int | None) -> None:
+        """
+        Shows how far a fetch got, and records it every `Config.PARTIAL_SAVE_BYTES` so a
+        restarted run knows the fetch can be resumed.
 
-    def _update_tags(self, mp3: Mp3) -> None:
+        Args:
+            mp3 (Mp3): The Mp3 object being fetched.
+            downloaded (int): Bytes of the stream downloaded so far.
+            total (int | None): Size of the stream, None if unknown.
         """
-        Updates the tags of a downloaded mp3 file.
+        self._progress.fetch_progress(mp3.url_id, mp3.title, downloaded, total)
+        if downloaded - mp3.fetched_bytes >= Config.PARTIAL_SAVE_BYTES:
+            mp3.fetched_bytes = downloaded
+            self._state.update(mp3)
+
+    def _transcode_file(self, mp3: Mp3) -> None:
+        """
+        Converts a fetched file into `Config.AUDIO_FORMAT` in the download folder, tags
+        and cover included, then removes the fetched file. Formats whose cover ffmpeg
+        cannot embed go on to the tag stage for it.
 
         Args:
-            mp3 (Mp3): The Mp3 object representing the file to update.
+            mp3 (Mp3): The Mp3 object representing the file to convert.
+        """
+        assert mp3.temp_path is not None
+        if mp3.file_path is None:
+            # Fetched by an older version, which named files only once converted.
+            self._assign_file_path(mp3)
+        assert mp3.file_path is not None
+        # The name was allocated to this track, anything there is a conversion that was
+        # interrupted before the state recorded it.
+        mp3.file_path.unlink(missing_ok=True)
+        cover = self._cover_for(mp3)
+        cover_embedded = cover is None or Config.AUDIO_FORMAT in transcode.COVER_FORMATS
+
+        with self._metrics.measure("transcode") as measurement:
+            transcode.transcode(
+                self._logger,
+                mp3.temp_path,
+                mp3.file_path,
+                Config.AUDIO_FORMAT,
+                Config.FFMPEG_PATH,
+                self._tags_for(mp3),
+                cover,
+            )
+            measurement.bytes = mp3.file_path.stat().st_size
+        mp3.temp_path.unlink(missing_ok=True)
+        # Partial fetches of other formats of the same video are of no use anymore.
+        for leftover in Config.RAW_FOLDER_PATH.glob(f"{mp3.url_id}.*"):
+            leftover.unlink(missing_ok=True)
+        mp3.temp_path = None
+        stat = mp3.file_path.stat()
+        self._disk_index[mp3.file_path.name] = reconcile.FileEntry(stat.st_size, stat.st_mtime)
+        # Tagged by ffmpeg already, the tag stage is skipped.
+        mp3.state = Mp3.State.DONE if cover_embedded else Mp3.State.DOWNLOADED
+        if mp3.state is Mp3.State.DONE:
+            self._deduplicate(mp3)
+        self._state.update(mp3)
+
+    def _downloader(self) -> downloads.Downloader:
+        """
+        Returns the download session of the calling worker, creating it on first use.
+
+        Returns:
+            downloads.Downloader: The session owned by the current thread.
+        """
+        downloader = getattr(self._downloaders, "downloader", None)
+        if downloader is None:
+            downloader = downloads.Downloader(
+                self._logger, Config.AUDIO_FORMAT, encode=False, limiter=self._limiter
+            )
+            self._downloaders.downloader = downloader
+            with self._downloaders_lock:
+                self._all_downloaders.append(downloader)
+        return downloader
+
+    def _close_downloaders(self) -> None:
+        """
+        Closes the download sessions of every worker.
+        """
+        with self._downloaders_lock:
+            for downloader in self._all_downloaders:
+                downloader.close()
+            self._all_downloaders.clear()
+        self._downloaders = threading.local()
+
+    def _tags_for(self, mp3: Mp3) -> dict[str, str]:
+        """
+        Returns the tags written to the file of an mp3.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to tag.
+
+        Returns:
+            dict[str, str]: The tags, see `update_tags.update_mp3_tags`.
         """
         tags = {"artist": mp3.artist, "title": mp3.title}
         if mp3.album is not None:
             tags["album"] = mp3.album
-        update_tags.update_mp3_tags(self._logger, mp3.file_path, tags)  # type: ignore
+        return tags
+
+    def _cover_for(self, mp3: Mp3) -> Path | None:
+        """
+        Returns the cover image of an mp3 from the album art cache, fetching it once per
+        album.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to find the cover of.
+
+        Returns:
+            Path | None: The cover image, None when there is none or it is disabled.
+        """
+        if self._album_art is None or mp3.thumbnail_url is None:
+            return None
+        # Every track of an album shares one cover, tracks without album use their own.
+        if mp3.album is not None:
+            key = f"{mp3.artist}\n{mp3.album}"
+        else:
+            key = mp3.thumbnail_url
+        with self._metrics.measure("album_art"):
+            return self._album_art.get(key, mp3.thumbnail_url)
+
+    def _update_tags(self, mp3: Mp3) -> None:
+        """
+        Updates the tags of a file that was downloaded without them, by an older version
+        or before it was adopted from the download folder, or whose cover ffmpeg could
+        not embed.
+
+        Args:
+            mp3 (Mp3): The Mp3 object representing the file to update.
+        """
+        cover = self._cover_for(mp3)
+        with self._metrics.measure("tag"):
+            update_tags.update_tags(
+                self._logger, mp3.file_path, self._tags_for(mp3), cover  # type: ignore
+            )
         mp3.state = Mp3.State.DONE
+        self._deduplicate(mp3)
+        self._state.update(mp3)
@@ -1,4 +1,4 @@
-import typing
+import typing, os
 from pathlib import Path
 from constants import AppMeta
 
@@ -11,6 +11,7 @@ class Config:
     such as file paths and templates.
     """
 
+    # One playlist URL per line, lines starting with # are ignored.
     PLAYLIST_URL_FILE: typing.Final[str] = "playlist_url.txt"
     PLAYLIST_URL_FILE_PATH: typing.Final[Path] = Path(PLAYLIST_URL_FILE)
     # Define the configuration for the application.
@@ -19,14 +20,121 @@ class Config:
     DOWNLOAD_FOLDER_PATH: typing.Final[Path] = Path(DOWNLOAD_FOLDER)
     # Temporary folder for processing files.
     TEMP_FOLDER: typing.Final[str] = "./temp"
+    # Fetched audio waiting to be converted, named {video id}.{format id}.{ext}, with
+    # unfinished fetches kept as .part files and resumed by the next run.
+    RAW_FOLDER: typing.Final[str] = "raw"
+    RAW_FOLDER_PATH: typing.Final[Path] = Path(TEMP_FOLDER, RAW_FOLDER)
     LOG_FILE: typing.Final[str] = f"{AppMeta.NAME}.log"
     LOG_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, LOG_FILE)
+    # Size at which the log file is rotated, 0 to let it grow, and how many rotated
+    # files are kept next to it.
+    LOG_MAX_BYTES: typing.Final[int] = 5 * 1024 * 1024
+    LOG_BACKUP_COUNT: typing.Final[int] = 3
+    # Write the log file as JSON lines, each record carrying the track it was logged for.
+    LOG_JSON: typing.Final[bool] = False
+    # Hand records to a single background writer, so download workers never wait on the
+    # log file or the console.
+    LOG_QUEUED: typing.Final[bool] = True
     # Temporary files
     # Save which files were downloaded from which links.
     CONTROL_FILE: typing.Final[str] = "control.json"
     CONTROL_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, CONTROL_FILE)
-    # Save links extracted from the playlist.html
-    PLAYLIST_JSON: typing.Final[str] = "playlist.json"
-    PLAYLIST_JSON_PATH: typing.Final[Path] = Path(TEMP_FOLDER, PLAYLIST_JSON)
-    # Supported tags: artist, title, album. Extension is not needed, it will be added .mp3
+    # The same, one line per track, read and written without holding it all as JSON.
+    CONTROL_LINES_FILE: typing.Final[str] = "control.jsonl"
+    CONTROL_LINES_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, CONTROL_LINES_FILE)
+    # Where to keep the state: "jsonl" for the JSON lines control file, "json" for the
+    # single document one, "sqlite" for a database that is queried instead of loaded,
+    # better suited to very large libraries. A state found in another control file is
+    # converted on first use.
+    STATE_BACKEND: typing.Final[str] = "jsonl"
+    STATE_DB_FILE: typing.Final[str] = "control.sqlite3"
+    STATE_DB_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, STATE_DB_FILE)
+    # Changes since the last control file checkpoint, one line per change.
+    JOURNAL_FILE: typing.Final[str] = "control.journal"
+    JOURNAL_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, JOURNAL_FILE)
+    # How many journal lines to collect before rewriting the control file.
+    JOURNAL_COMPACT_EVERY: typing.Final[int] = 1000
+    # Whether to fsync every journal line, survives power loss at the cost of speed.
+    JOURNAL_FSYNC: typing.Final[bool] = False
+    # Timings, bytes and outcomes of each stage of the last run, as JSON and in the
+    # Prometheus text format (for the node exporter textfile collector).
+    METRICS_FILE: typing.Final[str] = "metrics.json"
+    METRICS_FILE_PATH: typing.Final[Path] = Path(TEMP_FOLDER, METRICS_FILE)
+    METRICS_PROMETHEUS_FILE: typing.Final[str] = "metrics.prom"
+    METRICS_PROMETHEUS_FILE_PATH: typing.Final[Path] = Path(
+        TEMP_FOLDER, METRICS_PROMETHEUS_FILE
+    )
+    # Save links extracted from each playlist, one {playlist id}.json file per playlist.
+    PLAYLISTS_CACHE_FOLDER: typing.Final[str] = "playlists"
+    PLAYLISTS_CACHE_FOLDER_PATH: typing.Final[Path] = Path(
+        TEMP_FOLDER, PLAYLISTS_CACHE_FOLDER
+    )
+    # How many seconds a cached playlist is used before it is fetched again.
+    PLAYLIST_CACHE_TTL: typing.Final[int] = 6 * 60 * 60
+    # Seconds between two polls of the playlists in watch mode (main.py --watch), each
+    # wait moved at random by up to WATCH_JITTER of it so that several instances do not
+    # poll in step. Only the first poll may be served from the playlist cache.
+    WATCH_INTERVAL: typing.Final[float] = 30 * 60
+    WATCH_JITTER: typing.Final[float] = 0.1
+    # How many tracks of a playlist to fetch first, so downloads start before the rest of
+    # the playlist is fetched. Only used for a playlist that is not cached yet, a refresh
+    # fetches the whole playlist at once. 0 always fetches it at once.
+    PLAYLIST_PAGE_SIZE: typing.Final[int] = 100
+    # With more than one playlist, each track is stored once in the download folder and
+    # every playlist gets a folder here with links to its tracks, named by playlist id.
+    PLAYLIST_LINKS_FOLDER: typing.Final[str] = "playlists"
+    PLAYLIST_LINKS_FOLDER_PATH: typing.Final[Path] = Path(
+        DOWNLOAD_FOLDER, PLAYLIST_LINKS_FOLDER
+    )
+    # Output audio format: "mp3" re-encodes every track, "opus" and "m4a" keep the native
+    # YouTube stream and only remux it, which is faster and avoids a lossy transcode.
+    AUDIO_FORMAT: typing.Final[str] = "mp3"
+    # Whether to embed the album cover of each track.
+    ALBUM_ART: typing.Final[bool] = True
+    # Covers are fetched once per album and kept here, resized to at most ALBUM_ART_SIZE
+    # pixels wide and high. The least recently used ones are removed once the folder
+    # holds more than ALBUM_ART_CACHE_BYTES.
+    ALBUM_ART_FOLDER: typing.Final[str] = "art"
+    ALBUM_ART_FOLDER_PATH: typing.Final[Path] = Path(TEMP_FOLDER, ALBUM_ART_FOLDER)
+    ALBUM_ART_SIZE: typing.Final[int] = 500
+    ALBUM_ART_CACHE_BYTES: typing.Final[int] = 64 * 1024 * 1024
+    # Hash the audio of every finished file, tags left out, and replace a file holding the
+    # same recording as an earlier one by a hardlink to it. Linked files share their
+    # data, so they all show the tags of the first one. Off by default: every finished
+    # file is read again, through ffmpeg for formats other than mp3, all finished tracks
+    # are kept in memory, even with the sqlite backend, and only byte identical audio
+    # matches, which separate uploads of a song seldom are.
+    DEDUPLICATE: typing.Final[bool] = False
+    # Also skip downloading a new song whose artist and title match a finished one and
+    # whose duration differs by at most DEDUPLICATE_DURATION_TOLERANCE seconds, linking
+    # the finished file instead. Faster, but trusts the playlist metadata.
+    DEDUPLICATE_BY_METADATA: typing.Final[bool] = False
+    DEDUPLICATE_DURATION_TOLERANCE: typing.Final[float] = 2
+    # Supported tags: artist, title, album. Extension is not needed, AUDIO_FORMAT is added.
     FILE_NAME_TEMPLATE: typing.Final[str] = "{artist} - {title}"
+    # Processing pipeline, each stage has its own workers and bounded queue.
+    # How many tracks are downloaded at the same time.
+    DOWNLOAD_WORKERS: typing.Final[int] = 4
+    # How many newly fetched bytes of a track are recorded in the state at once.
+    PARTIAL_SAVE_BYTES: typing.Final[int] = 1024 * 1024
+    # Limits shared by every request to YouTube, 0 for unlimited. Concurrency is halved
+    # whenever a request is throttled and grows back while requests succeed.
+    RATE_LIMIT_REQUESTS_PER_SECOND: typing.Final[float] = 2.0
+    RATE_LIMIT_BYTES_PER_SECOND: typing.Final[float] = 0
+    # Failed files are retried after RETRY_BASE_DELAY seconds, doubling after each failure
+    # up to RETRY_MAX_DELAY, and given up on after RETRY_MAX_ATTEMPTS failures. A run waits
+    # at most RETRY_WAIT_IN_RUN seconds for a retry, later ones are left for the next run.
+    RETRY_BASE_DELAY: typing.Final[float] = 30
+    RETRY_MAX_DELAY: typing.Final[float] = 24 * 60 * 60
+    RETRY_MAX_ATTEMPTS: typing.Final[int] = 8
+    RETRY_WAIT_IN_RUN: typing.Final[float] = 60
+    # How many ffmpeg processes convert files at the same time, one per core by default.
+    TRANSCODE_WORKERS: typing.Final[int] = os.cpu_count() or 1
+    # The ffmpeg executable used for converting.
+    FFMPEG_PATH: typing.Final[str] = "ffmpeg"
+    # Most redraws of the console progress per second.
+    PROGRESS_REFRESH_RATE: typing.Final[float] = 4
+    # How many files get their tags written at the same time.
+    TAG_WORKERS: typing.Final[int] = 2
+    # How many tracks may wait in front of each stage.
+    STAGE_QUEUE_SIZE: typing.Final[int] = 64
@@ -0,0 +1,90 @@
+import json, os, typing
+from pathlib import Path
+
+
+class Journal:
+    """
+    Append-only log of state changes, written on top of the last checkpoint.
+
+    Every change is one small JSON line, so recording a transition costs a few bytes no
+    matter how large the library is. Records hold whole values (not deltas), which makes
+    replaying them more than once harmless, e.g. after a crash during compaction.
+    """
+
+    def __init__(self, file_path: Path, compact_every: int, fsync: bool = False):
+        """
+        Initializes the Journal.
+
+        Args:
+            file_path (Path): The path to the journal file.
+            compact_every (int): How many records to append before asking for a checkpoint.
+            fsync (bool): Whether to fsync after each record, slower but survives power loss.
+        """
+        self.file_path = file_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.pending: int = 0
+        self._file: typing.TextIO | None = None
+
+    def open(self) -> None:
+        """
+        Opens the journal file for appending.
+        """
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.file_path.open("a", encoding="utf-8")
+
+    def close(self) -> None:
+        """
+        Closes the journal file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, record: dict[str, typing.Any]) -> bool:
+        """
+        Appends a record to the journal.
+
+        Args:
+            record (dict[str, typing.Any]): The record to append.
+
+        Returns:
+            bool: True when enough records piled up that a checkpoint should be written.
+        """
+        if self._file is None:
+            return False
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.pending += 1
+        return self.pending >= self.compact_every
+
+    def read(self) -> typing.Iterator[dict[str, typing.Any]]:
+        """
+        Reads back the records in the journal file, in the order they were written.
+
+        A partially written last line, left by a crash, is skipped.
+
+        Returns:
+            typing.Iterator[dict[str, typing.Any]]: The records.
+        """
+        if not self.file_path.exists():
+            return
+        with self.file_path.open("r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def truncate(self) -> None:
+        """
+        Empties the journal, called once its records are part of a checkpoint.
+        """
+        if self._file is not None:
+            self._file.truncate(0)
+            self._file.seek(0)
+        else:
+            self.file_path.unlink(missing_ok=True)
+        self.pending = 0
@@ -1,3 +1,4 @@
+import sys, typing
 from enum import Enum
 from pathlib import Path
 
@@ -5,16 +6,43 @@ from pathlib import Path
 class Mp3:
     """
     Represents an MP3 file, containing its metadata and state.
+
+    Libraries hold hundreds of thousands of these, so they are kept small: attributes
+    live in slots instead of a `__dict__`, paths are stored as strings and only turned
+    into `Path` objects when read, and artist and album names are interned so the tracks
+    of an album share them.
     """
 
+    __slots__ = (
+        "url_id",
+        "title",
+        "artist",
+        "album",
+        "thumbnail_url",
+        "duration_seconds",
+        "_file_path",
+        "_temp_path",
+        "fetched_bytes",
+        "state",
+        "attempts",
+        "last_error",
+        "next_attempt_at",
+        "failed_state",
+        "content_hash",
+    )
+
     class State(Enum):
         """
         Represents the state of the MP3 file in the download process.
         """
 
         CREATED = 0
+        # Raw audio fetched into the temporary folder, not encoded yet.
+        FETCHED = 3
         DOWNLOADED = 1
         DONE = 2
+        # A step failed, retried from `failed_state` once `next_attempt_at` is reached.
+        FAILED = 4
 
     def __init__(self, url_id: str, title: str):
         """
@@ -28,45 +56,100 @@ class Mp3:
         self.title: str = title
         self.artist: str = ""
         self.album: str | None = None
-        self.file_path: Path | None = None
+        # Cover image of the track, usually the one of its album.
+        self.thumbnail_url: str | None = None
+        # Length of the track according to the playlist, 0 when unknown.
+        self.duration_seconds: int = 0
+        self._file_path: str | None = None
+        self._temp_path: str | None = None
+        # Bytes of the audio stream already in the temporary folder, while fetching.
+        self.fetched_bytes: int = 0
         self.state: Mp3.State = Mp3.State.CREATED
+        # Retry bookkeeping, see logic.retry.
+        self.attempts: int = 0
+        self.last_error: str = ""
+        self.next_attempt_at: float = 0.0
+        self.failed_state: Mp3.State | None = None
+        # Hash of the audio of the finished file, tags left out, see logic.content_index.
+        self.content_hash: str | None = None
+
+    @property
+    def file_path(self) -> Path | None:
+        """
+        Where the converted file is stored, None until a name is picked.
+        """
+        return Path(self._file_path) if self._file_path is not None else None
+
+    @file_path.setter
+    def file_path(self, value: Path | None) -> None:
+        self._file_path = str(value) if value is not None else None
+
+    @property
+    def temp_path(self) -> Path | None:
+        """
+        The fetched audio waiting to be converted, None when there is none.
+        """
+        return Path(self._temp_path) if self._temp_path is not None else None
+
+    @temp_path.setter
+    def temp_path(self, value: Path | None) -> None:
+        self._temp_path = str(value) if value is not None else None
 
     def __str__(self) -> str:
         return f"Mp3(url_id={self.url_id}, file_path={self.file_path}, artist={self.artist}, title={self.title}, album={self.album}, state={self.state})"
 
     __repr__ = __str__
 
-    def to_json(self) -> dict[str, str]:
+    def to_json(self) -> dict[str, typing.Any]:
         """
         Converts the Mp3 object to a JSON serializable dictionary.
 
         Returns:
-            dict[str, str]: The JSON representation of the Mp3 object.
+            dict[str, typing.Any]: The JSON representation of the Mp3 object.
         """
         return {
             "url_id": self.url_id,
-            "file_path": str(self.file_path) if self.file_path is not None else "",
+            "file_path": self._file_path if self._file_path is not None else "",
+            "temp_path": self._temp_path if self._temp_path is not None else "",
+            "fetched_bytes": self.fetched_bytes,
             "artist": self.artist,
             "title": self.title,
             "album": str(self.album) if self.album is not None else "",
+            "thumbnail_url": self.thumbnail_url if self.thumbnail_url is not None else "",
+            "duration_seconds": self.duration_seconds,
             "state": self.state.name,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "next_attempt_at": self.next_attempt_at,
+            "failed_state": self.failed_state.name if self.failed_state is not None else "",
+            "content_hash": self.content_hash if self.content_hash is not None else "",
         }
 
     @staticmethod
-    def from_json(data: dict[str, str]) -> "Mp3":
+    def from_json(data: dict[str, typing.Any]) -> "Mp3":
         """
         Creates an Mp3 object from a JSON dictionary.
 
         Args:
-            data (dict[str, str]): The JSON dictionary.
+            data (dict[str, typing.Any]): The JSON dictionary.
 
         Returns:
             Mp3: The created Mp3 object.
         """
         mp3 = Mp3(data["url_id"], data["title"])
-        file_path = data.get("file_path", "")
-        mp3.file_path = Path(file_path) if len(file_path) > 0 else None
-        mp3.artist = data.get("artist", "")
-        mp3.album = data.get("album", None)
+        mp3._file_path = data.get("file_path") or None
+        mp3._temp_path = data.get("temp_path") or None
+        mp3.fetched_bytes = int(data.get("fetched_bytes", 0))
+        mp3.artist = sys.intern(data.get("artist", ""))
+        album = data.get("album") or None
+        mp3.album = sys.intern(album) if album is not None else None
+        mp3.thumbnail_url = data.get("thumbnail_url") or None
+        mp3.duration_seconds = int(data.get("duration_seconds", 0))
         mp3.state = Mp3.State[data.get("state", Mp3.State.CREATED.name)]
+        mp3.attempts = int(data.get("attempts", 0))
+        mp3.last_error = data.get("last_error", "")
+        mp3.next_attempt_at = float(data.get("next_attempt_at", 0.0))
+        failed_state = data.get("failed_state", "")
+        mp3.failed_state = Mp3.State[failed_state] if len(failed_state) > 0 else None
+        mp3.content_hash = data.get("content_hash") or None
         return mp3
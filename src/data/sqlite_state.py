@@ -0,0 +1,301 @@
+import sqlite3, threading, typing, json
+from collections.abc import Mapping
+from pathlib import Path
+from data.mp3 import Mp3
+from data.state import State
+
+# Columns of the mp3s table besides url_id, named like the keys of `Mp3.to_json`.
+# Columns missing from an older database are added when it is opened.
+_FIELDS: typing.Final[dict[str, str]] = {
+    "file_path": "TEXT NOT NULL DEFAULT ''",
+    "temp_path": "TEXT NOT NULL DEFAULT ''",
+    "fetched_bytes": "INTEGER NOT NULL DEFAULT 0",
+    "artist": "TEXT NOT NULL DEFAULT ''",
+    "title": "TEXT NOT NULL DEFAULT ''",
+    "album": "TEXT NOT NULL DEFAULT ''",
+    "thumbnail_url": "TEXT NOT NULL DEFAULT ''",
+    "duration_seconds": "INTEGER NOT NULL DEFAULT 0",
+    "state": "TEXT NOT NULL DEFAULT 'CREATED'",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "last_error": "TEXT NOT NULL DEFAULT ''",
+    "next_attempt_at": "REAL NOT NULL DEFAULT 0",
+    "failed_state": "TEXT NOT NULL DEFAULT ''",
+    "content_hash": "TEXT NOT NULL DEFAULT ''",
+}
+
+_COLUMNS = ", ".join(["url_id", *_FIELDS])
+_VALUES = ", ".join(f":{name}" for name in ["url_id", *_FIELDS])
+_UPDATES = ", ".join(f"{name} = excluded.{name}" for name in _FIELDS)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mp3s (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_id TEXT NOT NULL UNIQUE
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS mp3s_file_path ON mp3s (file_path);
+CREATE INDEX IF NOT EXISTS mp3s_state ON mp3s (state);
+"""
+
+
+class _UrlIndex(Mapping[str, Mp3]):
+    """
+    Read only mapping from url id to Mp3, answered by the `url_id` index.
+    """
+
+    def __init__(self, state: "SqliteState"):
+        self._state = state
+
+    def __getitem__(self, url_id: str) -> Mp3:
+        mp3 = self._state._select_one("url_id = ?", (url_id,))
+        if mp3 is None:
+            raise KeyError(url_id)
+        return mp3
+
+    def __contains__(self, url_id: object) -> bool:
+        return self._state._exists("url_id = ?", (url_id,))
+
+    def __iter__(self) -> typing.Iterator[str]:
+        rows = self._state._execute("SELECT url_id FROM mp3s ORDER BY seq").fetchall()
+        return (row[0] for row in rows)
+
+    def __len__(self) -> int:
+        return self._state._execute("SELECT COUNT(*) FROM mp3s").fetchone()[0]
+
+
+class _FilePathIndex(Mapping[str, Mp3]):
+    """
+    Read only mapping from file path, as a string, to Mp3, answered by the `file_path`
+    index. Only files already downloaded are part of it, like `State.by_file_paths`.
+    """
+
+    _WHERE = "file_path = ? AND state IN ('DOWNLOADED', 'DONE')"
+
+    def __init__(self, state: "SqliteState"):
+        self._state = state
+
+    def __getitem__(self, file_path: str) -> Mp3:
+        mp3 = self._state._select_one(self._WHERE, (str(file_path),))
+        if mp3 is None:
+            raise KeyError(file_path)
+        return mp3
+
+    def __contains__(self, file_path: object) -> bool:
+        return self._state._exists(self._WHERE, (str(file_path),))
+
+    def __iter__(self) -> typing.Iterator[str]:
+        rows = self._state._execute(
+            "SELECT file_path FROM mp3s WHERE state IN ('DOWNLOADED', 'DONE') ORDER BY seq"
+        ).fetchall()
+        return (row[0] for row in rows)
+
+    def __len__(self) -> int:
+        return self._state._execute(
+            "SELECT COUNT(*) FROM mp3s WHERE state IN ('DOWNLOADED', 'DONE')"
+        ).fetchone()[0]
+
+
+class SqliteState:
+    """
+    Application state kept in a SQLite database instead of memory.
+
+    Offers the same surface as `State`, but `by_urls` and `by_file_paths` are answered by
+    indexes and Mp3 objects are only built when asked for, so a large library starts
+    without loading every track. Each change is committed on its own, so no journal or
+    checkpoint is needed.
+    """
+
+    def __init__(self, file_path: Path):
+        """
+        Initializes the SqliteState, creating the database if needed.
+
+        Args:
+            file_path (Path): The path to the SQLite database file.
+        """
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._add_missing_columns()
+        self._connection.executescript(_INDEXES)
+        self.by_urls: Mapping[str, Mp3] = _UrlIndex(self)
+        self.by_file_paths: Mapping[str, Mp3] = _FilePathIndex(self)
+
+    @property
+    def playlist_url_ids(self) -> list[str]:
+        """
+        The IDs of the playlists the state was built from.
+        """
+        row = self._execute("SELECT value FROM meta WHERE key = 'playlist_urls'").fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    @playlist_url_ids.setter
+    def playlist_url_ids(self, value: list[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('playlist_urls', ?)",
+                (json.dumps(list(value)),),
+            )
+
+    @property
+    def mp3s(self) -> list[Mp3]:
+        """
+        Every Mp3 in the state. Builds them all, prefer the narrower queries.
+        """
+        return list(self._select("1"))
+
+    def is_empty(self) -> bool:
+        """
+        Returns:
+            bool: True when the database holds no tracks and no playlist yet.
+        """
+        return len(self.by_urls) == 0 and len(self.playlist_url_ids) == 0
+
+    def add(self, mp3: Mp3) -> None:
+        """
+        Adds an Mp3 object to the state.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to add.
+        """
+        self.update(mp3)
+
+    def update(self, mp3: Mp3) -> None:
+        """
+        Writes the current values of an Mp3 object to the database.
+
+        Args:
+            mp3 (Mp3): The Mp3 object that changed.
+        """
+        data = mp3.to_json()
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT INTO mp3s ({_COLUMNS}) VALUES ({_VALUES}) "
+                f"ON CONFLICT (url_id) DO UPDATE SET {_UPDATES}",
+                data,
+            )
+
+    def remove(self, mp3: Mp3) -> None:
+        """
+        Removes an Mp3 object from the state.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to remove.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM mp3s WHERE url_id = ?", (mp3.url_id,))
+
+    def remove_many(self, mp3s: typing.Iterable[Mp3]) -> None:
+        """
+        Removes several Mp3 objects from the state in a single transaction.
+
+        Args:
+            mp3s (typing.Iterable[Mp3]): The Mp3 objects to remove.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM mp3s WHERE url_id = ?", ((mp3.url_id,) for mp3 in mp3s)
+            )
+
+    def pending(self) -> typing.Iterator[Mp3]:
+        """
+        Returns:
+            typing.Iterator[Mp3]: The Mp3 objects not done yet.
+        """
+        # Listed rather than "!= 'DONE'", so the state index is used.
+        return self._select("state IN ('CREATED', 'FETCHED', 'DOWNLOADED', 'FAILED')")
+
+    def with_files(self) -> typing.Iterator[Mp3]:
+        """
+        Returns:
+            typing.Iterator[Mp3]: The Mp3 objects whose file was already downloaded.
+        """
+        return self._select("state IN ('DOWNLOADED', 'DONE')")
+
+    def checkpoint(self) -> None:
+        """
+        Checkpoints the SQLite write-ahead log into the database file.
+        """
+        with self._lock:
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def import_state(self, state: State) -> None:
+        """
+        Copies every entry of an in-memory state, used to migrate from the control file.
+
+        Args:
+            state (State): The state to copy.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO mp3s ({_COLUMNS}) VALUES ({_VALUES})",
+                (mp3.to_json() for mp3 in state.mp3s),
+            )
+        self.playlist_url_ids = state.playlist_url_ids
+
+    def close(self) -> None:
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def _add_missing_columns(self) -> None:
+        """
+        Adds the columns of `_FIELDS` that an older database does not have yet.
+        """
+        existing = {row[1] for row in self._connection.execute("PRAGMA table_info(mp3s)")}
+        with self._connection:
+            for name, definition in _FIELDS.items():
+                if name not in existing:
+                    self._connection.execute(
+                        f"ALTER TABLE mp3s ADD COLUMN {name} {definition}"
+                    )
+
+    def _execute(self, sql: str, parameters: typing.Sequence[typing.Any] = ()) -> sqlite3.Cursor:
+        """
+        Runs a query while holding the lock.
+        """
+        with self._lock:
+            return self._connection.execute(sql, parameters)
+
+    def _select(
+        self, where: str, parameters: typing.Sequence[typing.Any] = ()
+    ) -> typing.Iterator[Mp3]:
+        """
+        Builds the Mp3 objects matching a condition, in insertion order.
+        """
+        rows = self._execute(
+            f"SELECT {_COLUMNS} FROM mp3s WHERE {where} ORDER BY seq", parameters
+        ).fetchall()
+        return (Mp3.from_json(dict(row)) for row in rows)
+
+    def _select_one(
+        self, where: str, parameters: typing.Sequence[typing.Any]
+    ) -> Mp3 | None:
+        """
+        Builds the first Mp3 object matching a condition.
+        """
+        row = self._execute(
+            f"SELECT {_COLUMNS} FROM mp3s WHERE {where} LIMIT 1", parameters
+        ).fetchone()
+        return Mp3.from_json(dict(row)) if row is not None else None
+
+    def _exists(self, where: str, parameters: typing.Sequence[typing.Any]) -> bool:
+        """
+        Checks whether any row matches a condition.
+        """
+        return (
+            self._execute(f"SELECT 1 FROM mp3s WHERE {where} LIMIT 1", parameters).fetchone()
+            is not None
+        )
@@ -1,6 +1,10 @@
-import typing
+import os, json, typing, threading, utils
 from pathlib import Path
 from data.mp3 import Mp3
+from data.journal import Journal
+
+# Bumped whenever the layout of the JSON lines state file changes.
+JSONL_VERSION: typing.Final[int] = 1
 
 
 class State:
@@ -8,31 +12,160 @@ class State:
     Represents the application state.
 
     This class holds all the data that needs to be persisted between application runs,
-    such as the list of MP3 files, their states.
+    such as the list of MP3 files, their states. All mutations go through a lock so the
+    state can be shared by the download workers.
+
+    When a journal is attached, every change is appended to it and the whole state is
+    only written as a checkpoint once the journal grows past its compaction threshold.
+
+    The checkpoint is either a single JSON document, see `to_json`, or JSON lines, see
+    `write_jsonl`, which is read and written one track at a time.
     """
 
     def __init__(self):
         """
         Initializes the State object.
         """
-        self.playlist_url_id: str = ""
+        self._playlist_url_ids: list[str] = []
         self.mp3s: list[Mp3] = []
         self.by_urls: dict[str, Mp3] = {}
-        self.by_file_paths: dict[Path, Mp3] = {}
+        # Keyed by the file path as a string, so the index holds no Path objects.
+        self.by_file_paths: dict[str, Mp3] = {}
+        self._lock = threading.RLock()
+        self._journal: Journal | None = None
+        self._checkpoint_path: Path | None = None
+        self._checkpoint_lines: bool = False
 
-    def add(self, mp3: Mp3) -> None:
+    @property
+    def playlist_url_ids(self) -> list[str]:
         """
-        Adds an Mp3 object to the state.
+        The IDs of the playlists the state was built from.
+        """
+        return list(self._playlist_url_ids)
+
+    @playlist_url_ids.setter
+    def playlist_url_ids(self, value: list[str]) -> None:
+        with self._lock:
+            self._playlist_url_ids = list(value)
+            self._record({"op": "playlists", "ids": self._playlist_url_ids})
+
+    def attach_journal(
+        self, journal: Journal, checkpoint_path: Path, lines: bool = False
+    ) -> None:
+        """
+        Starts recording every change to a journal.
 
         Args:
-            mp3 (Mp3): The Mp3 object to add.
+            journal (Journal): The opened journal to append changes to.
+            checkpoint_path (Path): Where to write the full state when compacting.
+            lines (bool): Whether the checkpoint is written as JSON lines.
+        """
+        self._journal = journal
+        self._checkpoint_path = checkpoint_path
+        self._checkpoint_lines = lines
+
+    def replay(self, journal: Journal) -> int:
+        """
+        Applies the records of a journal written by a previous run.
+
+        A track put again is replaced where it is in the list, and removed tracks are
+        only dropped from the list once every record is applied, so replaying costs the
+        same whatever the size of the state.
+
+        Args:
+            journal (Journal): The journal to read the records from.
+
+        Returns:
+            int: The number of records applied.
+        """
+        count = 0
+        with self._lock:
+            positions = {mp3.url_id: i for i, mp3 in enumerate(self.mp3s)}
+            removed = 0
+            for record in journal.read():
+                match record.get("op"):
+                    case "put":
+                        mp3 = Mp3.from_json(record["mp3"])
+                        old = self.by_urls.get(mp3.url_id)
+                        if old is not None:
+                            self._unindex(old)
+                            self.mp3s[positions[mp3.url_id]] = mp3
+                        else:
+                            positions[mp3.url_id] = len(self.mp3s)
+                            self.mp3s.append(mp3)
+                        self._index(mp3)
+                    case "del":
+                        old = self.by_urls.get(record["url_id"])
+                        if old is not None:
+                            self._unindex(old)
+                            # Dropped from the list once the journal is replayed.
+                            self.mp3s[positions.pop(old.url_id)] = None  # type: ignore
+                            removed += 1
+                    case "playlists":
+                        self._playlist_url_ids = list(record["ids"])
+                count += 1
+            if removed > 0:
+                self.mp3s = [mp3 for mp3 in self.mp3s if mp3 is not None]
+        return count
+
+    def _index(self, mp3: Mp3) -> None:
+        """
+        Adds an Mp3 object to the lookup indexes.
         """
-        self.mp3s.append(mp3)
         self.by_urls[mp3.url_id] = mp3
         if mp3.state in (Mp3.State.DOWNLOADED, Mp3.State.DONE):
             assert mp3.file_path is not None
-            path: Path = mp3.file_path
-            self.by_file_paths[path] = mp3
+            self.by_file_paths[str(mp3.file_path)] = mp3
+
+    def _unindex(self, mp3: Mp3) -> None:
+        """
+        Removes an Mp3 object from the lookup indexes.
+        """
+        self.by_urls.pop(mp3.url_id, None)
+        if mp3.file_path is not None:
+            self.by_file_paths.pop(str(mp3.file_path), None)
+
+    def checkpoint(self) -> None:
+        """
+        Writes the full state to the checkpoint file and empties the journal.
+
+        The checkpoint is replaced atomically, so a crash leaves either the old or the new
+        checkpoint on disk, and the journal still holds everything since the old one.
+        """
+        with self._lock:
+            if self._checkpoint_path is None:
+                return
+            if self._checkpoint_lines:
+                self.write_jsonl(self._checkpoint_path)
+            else:
+                utils.write_json_file(self._checkpoint_path, self.to_json(), indent=None)
+            if self._journal is not None:
+                self._journal.truncate()
+
+    def add(self, mp3: Mp3) -> None:
+        """
+        Adds an Mp3 object to the state.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to add.
+        """
+        with self._lock:
+            self.mp3s.append(mp3)
+            self._index(mp3)
+            self._record({"op": "put", "mp3": mp3.to_json()})
+
+    def update(self, mp3: Mp3) -> None:
+        """
+        Refreshes the indexes after an Mp3 object already in the state was changed.
+
+        Args:
+            mp3 (Mp3): The Mp3 object that changed.
+        """
+        with self._lock:
+            if mp3.state in (Mp3.State.DOWNLOADED, Mp3.State.DONE):
+                assert mp3.file_path is not None
+                self.by_file_paths[str(mp3.file_path)] = mp3
+            self._record({"op": "put", "mp3": mp3.to_json()})
 
     def remove(self, mp3: Mp3) -> None:
         """
@@ -41,16 +174,62 @@ class State:
         Args:
             mp3 (Mp3): The Mp3 object to remove.
         """
-        for index, item in enumerate(self.mp3s):
-            if item.url_id == mp3.url_id:
-                del self.mp3s[index]
-                break
+        with self._lock:
+            for index, item in enumerate(self.mp3s):
+                if item.url_id == mp3.url_id:
+                    del self.mp3s[index]
+                    break
 
-        self.by_urls.pop(mp3.url_id, None)
+            self.by_urls.pop(mp3.url_id, None)
 
-        if mp3.state in (Mp3.State.DOWNLOADED, Mp3.State.DONE):
-            assert mp3.file_path is not None
-            self.by_file_paths.pop(mp3.file_path, None)
+            if mp3.state in (Mp3.State.DOWNLOADED, Mp3.State.DONE):
+                assert mp3.file_path is not None
+                self.by_file_paths.pop(str(mp3.file_path), None)
+            self._record({"op": "del", "url_id": mp3.url_id})
+
+    def remove_many(self, mp3s: typing.Iterable[Mp3]) -> None:
+        """
+        Removes several Mp3 objects from the state in a single pass over the list.
+
+        Args:
+            mp3s (typing.Iterable[Mp3]): The Mp3 objects to remove.
+        """
+        with self._lock:
+            removed = {mp3.url_id: mp3 for mp3 in mp3s}
+            if len(removed) == 0:
+                return
+            self.mp3s = [mp3 for mp3 in self.mp3s if mp3.url_id not in removed]
+            for mp3 in removed.values():
+                self.by_urls.pop(mp3.url_id, None)
+                if mp3.file_path is not None:
+                    self.by_file_paths.pop(str(mp3.file_path), None)
+                self._record({"op": "del", "url_id": mp3.url_id})
+
+    def _record(self, record: dict[str, typing.Any]) -> None:
+        """
+        Appends a change to the journal, compacting it when it grew too long.
+
+        Args:
+            record (dict[str, typing.Any]): The change to record.
+        """
+        if self._journal is not None and self._journal.append(record):
+            self.checkpoint()
+
+    def pending(self) -> typing.Iterator[Mp3]:
+        """
+        Returns:
+            typing.Iterator[Mp3]: The Mp3 objects not done yet.
+        """
+        with self._lock:
+            return iter([mp3 for mp3 in self.mp3s if mp3.state is not Mp3.State.DONE])
+
+    def with_files(self) -> typing.Iterator[Mp3]:
+        """
+        Returns:
+            typing.Iterator[Mp3]: The Mp3 objects whose file was already downloaded.
+        """
+        with self._lock:
+            return iter(list(self.by_file_paths.values()))
 
     def to_json(self) -> dict[str, typing.Any]:
         """
@@ -59,10 +238,11 @@ class State:
         Returns:
             dict[str, typing.Any]: The JSON representation of the State object.
         """
-        return {
-            "playlist_url": self.playlist_url_id,
-            "mp3s": [mp3.to_json() for mp3 in self.mp3s],
-        }
+        with self._lock:
+            return {
+                "playlist_urls": self._playlist_url_ids,
+                "mp3s": [mp3.to_json() for mp3 in self.mp3s],
+            }
 
     @staticmethod
     def from_json(json_data: dict[str, typing.Any]) -> "State":
@@ -76,9 +256,55 @@ class State:
             State: The created State object.
         """
         state = State()
-        state.playlist_url_id = json_data.get("playlist_url", "")
+        state._playlist_url_ids = json_data.get("playlist_urls", [])
+        # Older control files only knew a single playlist.
+        if len(json_data.get("playlist_url", "")) > 0 and not state._playlist_url_ids:
+            state._playlist_url_ids = [json_data["playlist_url"]]
         mp3s_json_data = json_data.get("mp3s", [])
         for mp3_json_data in mp3s_json_data:
             mp3 = Mp3.from_json(mp3_json_data)
             state.add(mp3)
         return state
+
+    def write_jsonl(self, file_path: Path) -> None:
+        """
+        Writes the state as JSON lines: a first line with the playlists, then one line
+        per Mp3 object. Tracks are serialized one at a time, never as a whole document.
+
+        The file is written next to the target and renamed over it, so readers never see
+        a half written file.
+
+        Args:
+            file_path (Path): The path to the JSON lines file.
+        """
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = file_path.with_name(file_path.name + ".tmp")
+        with self._lock, open(temp_path, "w", encoding="utf-8") as file:
+            header = {"version": JSONL_VERSION, "playlist_urls": self._playlist_url_ids}
+            file.write(json.dumps(header, separators=(",", ":")) + "\n")
+            for mp3 in self.mp3s:
+                file.write(json.dumps(mp3.to_json(), separators=(",", ":")) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+
+    @staticmethod
+    def read_jsonl(file_path: Path) -> "State":
+        """
+        Creates a State object from a file written by `write_jsonl`, one line at a time.
+
+        Args:
+            file_path (Path): The path to the JSON lines file.
+
+        Returns:
+            State: The created State object.
+        """
+        state = State()
+        with open(file_path, "r", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != JSONL_VERSION:
+                raise Exception(f"Unknown state version {header.get('version')}")
+            state._playlist_url_ids = header.get("playlist_urls", [])
+            for line in file:
+                state.add(Mp3.from_json(json.loads(line)))
+        return state
@@ -0,0 +1,136 @@
+import os, hashlib, threading, subprocess, contextlib, urllib.request
+from collections import OrderedDict
+from logging import Logger
+from pathlib import Path
+
+
+class AlbumArtCache:
+    """
+    Album covers on disk, fetched and resized once and shared by every track of an album.
+
+    Images are keyed by a caller chosen string, such as the album, and stored as
+    `{sha1 of key}.jpg`. The folder is kept under a size budget by evicting the least
+    recently used images, the file modification time recording the last use so the
+    order survives restarts. Thread safe; concurrent requests for the same key wait for
+    a single fetch.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        folder: Path,
+        max_bytes: int,
+        size: int = 500,
+        ffmpeg: str = "ffmpeg",
+    ):
+        """
+        Initializes the AlbumArtCache, indexing the images already in the folder.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            folder (Path): The folder holding the cached images.
+            max_bytes (int): Most bytes of images kept, 0 for no limit.
+            size (int): Largest width and height of the stored images, in pixels.
+            ffmpeg (str): The ffmpeg executable used to resize the images.
+        """
+        self._logger = logger
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.size = size
+        self._ffmpeg = ffmpeg
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        # File name to size, least recently used first.
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.folder.mkdir(parents=True, exist_ok=True)
+        found = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size_bytes in sorted(found):
+            self._entries[name] = size_bytes
+            self._total_bytes += size_bytes
+
+    def get(self, key: str, url: str) -> Path | None:
+        """
+        Returns the cached image for a key, fetching and resizing it from the URL first
+        if needed.
+
+        Args:
+            key (str): What the image belongs to, e.g. the album.
+            url (str): Where to fetch the image from when it is not cached.
+
+        Returns:
+            Path | None: The JPEG image, None when it could not be fetched.
+        """
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg"
+        with self._lock:
+            key_lock = self._key_locks.setdefault(name, threading.Lock())
+        with key_lock:
+            file_path = self.folder / name
+            with self._lock:
+                cached = name in self._entries
+                if cached:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if cached:
+                with contextlib.suppress(OSError):
+                    os.utime(file_path)
+                return file_path
+            try:
+                self._fetch(url, file_path)
+            except Exception as e:
+                self._logger.warning("Could not fetch album art %s: %s", url, e)
+                return None
+            with self._lock:
+                self._entries[name] = file_path.stat().st_size
+                self._total_bytes += self._entries[name]
+                self._evict()
+            return file_path
+
+    def _fetch(self, url: str, file_path: Path) -> None:
+        """
+        Downloads an image and writes it resized to the file, replacing it atomically.
+        """
+        # Thumbnails are served by an image CDN, not by YouTube itself, so they do not
+        # go through the download rate limiter.
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        download_path = file_path.with_suffix(".download")
+        resized_path = file_path.with_suffix(".tmp.jpg")
+        try:
+            download_path.write_bytes(data)
+            scale = (
+                f"scale=w={self.size}:h={self.size}:force_original_aspect_ratio=decrease"
+            )
+            command = [self._ffmpeg, "-nostdin", "-loglevel", "error", "-y"]
+            command += ["-i", str(download_path), "-vf", scale, "-q:v", "3"]
+            command += [str(resized_path)]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise Exception(f"ffmpeg failed: {result.stderr.strip()}")
+            os.replace(resized_path, file_path)
+            self._logger.debug("Cached album art %s as %s", url, file_path.name)
+        finally:
+            download_path.unlink(missing_ok=True)
+            resized_path.unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used images until the cache fits its budget. The most
+        recent image always stays. Called with the lock held.
+        """
+        if self.max_bytes <= 0:
+            return
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size_bytes = self._entries.popitem(last=False)
+            self._total_bytes -= size_bytes
+            (self.folder / name).unlink(missing_ok=True)
+            self._logger.debug("Evicted album art %s", name)
@@ -0,0 +1,149 @@
+import hashlib, threading, subprocess, typing
+from pathlib import Path
+from data.mp3 import Mp3
+
+# Bytes read at a time while hashing.
+CHUNK_SIZE: typing.Final[int] = 1024 * 1024
+# Size of an ID3v1 tag, kept at the very end of mp3 files.
+ID3V1_SIZE: typing.Final[int] = 128
+# Size of the header, and of the footer, of ID3v2 and APEv2 tags.
+TAG_HEADER_SIZE: typing.Final[int] = 10
+APE_FOOTER_SIZE: typing.Final[int] = 32
+
+
+def audio_hash(file_path: Path, ffmpeg: str = "ffmpeg") -> str:
+    """
+    Hashes the audio of a file, leaving its tags and cover out, so two files of the same
+    recording hash the same whatever they are tagged with.
+
+    Mp3 files are hashed directly, without their ID3v2, APEv2 and ID3v1 tags. Other
+    formats keep their tags inside the container, ffmpeg hashes their audio packets.
+
+    Args:
+        file_path (Path): The audio file.
+        ffmpeg (str): The ffmpeg executable, used for formats other than mp3.
+
+    Returns:
+        str: The SHA-256 of the audio, as hex.
+    """
+    if file_path.suffix.lower() == ".mp3":
+        return _mp3_audio_hash(file_path)
+    command = [ffmpeg, "-nostdin", "-loglevel", "error", "-i", str(file_path)]
+    command += ["-map", "0:a", "-codec", "copy", "-f", "hash", "-hash", "sha256", "-"]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed on {file_path}: {result.stderr.strip()}")
+    # Printed as SHA256=<hex>.
+    return result.stdout.strip().partition("=")[2]
+
+
+def _mp3_audio_hash(file_path: Path) -> str:
+    """
+    Hashes the bytes of an mp3 file between its leading and trailing tags.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        end = file.seek(0, 2)
+        start = 0
+        # ID3v2 tags at the start, possibly more than one.
+        while True:
+            file.seek(start)
+            header = file.read(TAG_HEADER_SIZE)
+            if len(header) < TAG_HEADER_SIZE or header[:3] != b"ID3":
+                break
+            # Syncsafe size: 7 bits per byte, header and footer not included.
+            size = 0
+            for byte in header[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            start += TAG_HEADER_SIZE + size
+            if header[5] & 0x10:
+                start += TAG_HEADER_SIZE
+        if end - start >= ID3V1_SIZE:
+            file.seek(end - ID3V1_SIZE)
+            if file.read(3) == b"TAG":
+                end -= ID3V1_SIZE
+        if end - start >= APE_FOOTER_SIZE:
+            file.seek(end - APE_FOOTER_SIZE)
+            footer = file.read(APE_FOOTER_SIZE)
+            if footer[:8] == b"APETAGEX":
+                # The size counts the items and the footer, not the optional header.
+                end -= int.from_bytes(footer[12:16], "little")
+                if footer[23] & 0x80:
+                    end -= APE_FOOTER_SIZE
+        file.seek(start)
+        remaining = max(0, end - start)
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if len(chunk) == 0:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """
+    The finished tracks of the library by the hash of their audio, and by artist and
+    title, to find the ones holding the same recording. Thread safe.
+    """
+
+    def __init__(self, duration_tolerance: float = 2):
+        """
+        Initializes the ContentIndex.
+
+        Args:
+            duration_tolerance (float): Most seconds two durations differ by for tracks
+                with the same artist and title to count as the same recording.
+        """
+        self.duration_tolerance = duration_tolerance
+        self._by_hash: dict[str, Mp3] = {}
+        self._by_track: dict[tuple[str, str], list[Mp3]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def add(self, mp3: Mp3) -> Mp3:
+        """
+        Indexes a finished mp3 by its `content_hash`.
+
+        Args:
+            mp3 (Mp3): The Mp3 object, with its content hash set.
+
+        Returns:
+            Mp3: The first mp3 indexed with the same hash, `mp3` itself if none was.
+        """
+        assert mp3.content_hash is not None
+        with self._lock:
+            self._by_track.setdefault(_track_key(mp3), []).append(mp3)
+            return self._by_hash.setdefault(mp3.content_hash, mp3)
+
+    def find_same_track(self, mp3: Mp3) -> Mp3 | None:
+        """
+        Looks for an indexed mp3 that has the same artist and title, compared case
+        insensitively, and about the same duration. Tracks of unknown duration never
+        match.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to look for, e.g. one just found in a playlist.
+
+        Returns:
+            Mp3 | None: The matching mp3, None if there is none.
+        """
+        if mp3.duration_seconds <= 0:
+            return None
+        with self._lock:
+            for candidate in self._by_track.get(_track_key(mp3), []):
+                if candidate.duration_seconds <= 0:
+                    continue
+                difference = abs(candidate.duration_seconds - mp3.duration_seconds)
+                if difference <= self.duration_tolerance:
+                    return candidate
+        return None
+
+
+def _track_key(mp3: Mp3) -> tuple[str, str]:
+    """
+    Returns the artist and title of an mp3, normalized for comparison.
+    """
+    return mp3.artist.strip().casefold(), mp3.title.strip().casefold()
@@ -1,54 +1,216 @@
-import typing, logging
+import typing, logging, contextlib
 from logging import Logger
 from pathlib import Path
-import yt_dlp
+from logic.rate_limit import RateLimiter, is_throttled
+
+# yt-dlp format selection and target codec for each supported output format. "mp3"
+# re-encodes the best audio stream, the others pick a stream already in that codec so
+# yt-dlp only remuxes it.
+AUDIO_FORMATS: typing.Final[dict[str, tuple[str, str]]] = {
+    "mp3": ("bestaudio/best", "mp3"),
+    "opus": ("bestaudio[acodec=opus]/bestaudio", "opus"),
+    "m4a": ("bestaudio[ext=m4a]/bestaudio", "m4a"),
+}
+
+
+class Downloader:
+    """
+    A long lived yt-dlp session, reused for many tracks by a single worker.
+
+    Creating a `yt_dlp.YoutubeDL` loads its extractors and opens fresh HTTP connections,
+    so each worker keeps one and only swaps the output template between tracks. Its
+    connection pool and cookie jar carry over from one track to the next. Not thread
+    safe, use one per thread.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        audio_format: str = "mp3",
+        options: dict[str, typing.Any] | None = None,
+        encode: bool = True,
+        limiter: RateLimiter | None = None,
+    ):
+        """
+        Initializes the Downloader.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            audio_format (str): The output format, one of `AUDIO_FORMATS`. Only "mp3"
+                re-encodes the audio.
+            options (dict[str, typing.Any] | None): yt-dlp options that override the defaults.
+            encode (bool): Whether yt-dlp converts to `audio_format` itself. Without it the
+                stream is kept as fetched, for `fetch` and a separate transcode step.
+            limiter (RateLimiter | None): Shared limits every download passes through.
+        """
+        # yt-dlp takes a good part of a second to import, load it only once a download
+        # session is actually needed.
+        import yt_dlp
+
+        self._logger = logger
+        self._limiter = limiter
+        # Bytes already accounted to the limiter, per file being downloaded.
+        self._accounted: dict[str, int] = {}
+        # Receives (downloaded bytes, total bytes or None) during a fetch.
+        self._progress_callback: typing.Callable[[int, int | None], None] | None = None
+        disabled_yt_logger = logging.getLogger("ytmusicapi")
+        disabled_yt_logger.disabled = True
+        format_selector, codec = AUDIO_FORMATS[audio_format]
+        ydl_opts: dict[str, typing.Any] = {
+            "format": format_selector,
+            "postprocessors": [
+                {
+                    "key": "FFmpegExtractAudio",
+                    "preferredcodec": codec,
+                    "preferredquality": "192",
+                }
+            ],
+            "outtmpl": "%(id)s.%(ext)s",
+            "quiet": False,
+            "no_warnings": False,
+            "logger": disabled_yt_logger,
+            "progress_hooks": [self._on_progress],
+            # Keep unfinished downloads as .part files and resume them with range requests.
+            "continuedl": True,
+            "nopart": False,
+        }
+        if not encode:
+            ydl_opts["postprocessors"] = []
+        if options is not None:
+            ydl_opts.update(options)
+        self._ydl = yt_dlp.YoutubeDL(ydl_opts)
+
+    def download(self, url: str, output_path: Path) -> None:
+        """
+        Downloads audio from a YouTube URL and saves it in the session's output format.
+
+        Args:
+            url (str): The YouTube URL to download from.
+            output_path (Path): The path to save the downloaded file to, its suffix must
+                match the output format.
+        """
+        if output_path.exists():
+            self._logger.error("Output path already exists %s", output_path)
+            raise Exception(f"Output path already exists {output_path}")
+
+        self._logger.debug("Starting download for: %s", url)
+
+        # Ensure output folder exists
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._set_output_template(str(output_path.with_suffix("")))
+
+        # The template has no extension, the audio extraction adds the one of the format.
+        self._extract(url)
+        self._logger.debug("Successfully downloaded: %s", output_path)
+
+    def fetch(
+        self,
+        url: str,
+        url_id: str,
+        folder: Path,
+        on_progress: typing.Callable[[int, int | None], None] | None = None,
+    ) -> Path:
+        """
+        Downloads the selected audio stream as is, without converting it.
+
+        The file is named after the video id and stream format, so an interrupted fetch
+        leaves a `.part` file that the next fetch of the same stream resumes from its
+        current size instead of starting over.
+
+        Args:
+            url (str): The YouTube URL to download from.
+            url_id (str): The video id, used as the file name.
+            folder (Path): The folder to save the fetched file to.
+            on_progress (typing.Callable[[int, int | None], None] | None): Called with
+                the bytes downloaded so far, counting resumed ones, and the total if known.
+
+        Returns:
+            Path: The fetched file, its extension is the one of the stream.
+        """
+        self._logger.debug("Starting fetch for: %s", url)
+        folder.mkdir(parents=True, exist_ok=True)
+        self._set_output_template(str(folder / f"{url_id}.%(format_id)s.%(ext)s"))
+        self._progress_callback = on_progress
+        try:
+            info_dict = self._extract(url)
+        finally:
+            self._progress_callback = None
+        requested = info_dict.get("requested_downloads") or [{}]
+        fetched = Path(requested[0].get("filepath") or self._ydl.prepare_filename(info_dict))
+        self._logger.debug("Successfully fetched: %s", fetched)
+        return fetched
+
+    def close(self) -> None:
+        """
+        Closes the yt-dlp session and its connections.
+        """
+        self._ydl.close()
+
+    def _extract(self, url: str) -> dict[str, typing.Any]:
+        """
+        Runs a yt-dlp download through the rate limiter, reporting throttling to it.
+        """
+        slot = self._limiter.slot() if self._limiter is not None else contextlib.nullcontext()
+        try:
+            with slot:
+                info_dict = self._ydl.extract_info(url, download=True)
+        except Exception as e:
+            if self._limiter is not None and is_throttled(e):
+                backoff = self._limiter.throttled()
+                self._logger.warning(
+                    "Throttled while downloading %s, backing off %.0fs with %d concurrent "
+                    "downloads",
+                    url,
+                    backoff,
+                    self._limiter.concurrency.limit,
+                )
+            raise
+        finally:
+            self._accounted.clear()
+        if self._limiter is not None:
+            self._limiter.succeeded()
+        return info_dict
+
+    def _on_progress(self, status: dict[str, typing.Any]) -> None:
+        """
+        yt-dlp progress hook, hands newly downloaded bytes to the rate limiter and the
+        progress callback of the current fetch.
+        """
+        downloaded = status.get("downloaded_bytes") or 0
+        if self._progress_callback is not None:
+            total = status.get("total_bytes") or status.get("total_bytes_estimate")
+            self._progress_callback(downloaded, int(total) if total else None)
+        if self._limiter is None:
+            return
+        file_name = status.get("filename", "")
+        # A resumed download starts counting at the size of its .part file.
+        previous = self._accounted.setdefault(file_name, downloaded)
+        self._accounted[file_name] = downloaded
+        self._limiter.consume_bytes(downloaded - previous)
+
+    def _set_output_template(self, template: str) -> None:
+        """
+        Points the next download of the session at a new output template.
+        """
+        outtmpl = self._ydl.params.get("outtmpl")
+        if isinstance(outtmpl, dict):
+            outtmpl["default"] = template
+        else:
+            self._ydl.params["outtmpl"] = {"default": template}
 
 
 def download_yt_audio(logger: Logger, url: str, output_path: Path) -> None:
     """
-    Downloads audio from a YouTube URL and saves it as an MP3 file.
+    Downloads audio from a YouTube URL and saves it as an MP3 file, using a one-off
+    session. Prefer a `Downloader` when downloading many tracks.
 
     Args:
         logger (Logger): The logger to use for logging.
         url (str): The YouTube URL to download from.
         output_path (Path): The path to save the downloaded MP3 file to.
     """
-    if output_path.exists():
-        logger.error(f"Output path already exists {output_path}")
-        raise Exception(f"Output path already exists {output_path}")
-
-    logger.debug(f"Starting download for: {url}")
-
-    # Ensure output folder exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    disabled_yt_logger = logging.getLogger("ytmusicapi")
-    disabled_yt_logger.disabled = True
-    ydl_opts: dict[str, typing.Any] = {
-        "format": "bestaudio/best",
-        "postprocessors": [
-            {
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "192",
-            }
-        ],
-        "outtmpl": str(output_path.with_suffix("")),
-        "quiet": False,
-        "no_warnings": False,
-        "logger": disabled_yt_logger,
-    }
-
+    downloader = Downloader(logger)
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # @TODO: review it, make path be exactly
-            info_dict = ydl.extract_info(url, download=True)
-            downloaded_file = (
-                ydl.prepare_filename(info_dict)
-                .replace(".webm", output_path.suffix)
-                .replace(".m4a", output_path.suffix)
-            )
-            logger.debug(f"\nSuccessfully downloaded: {downloaded_file}")
-            return
-    except Exception as e:
-        logger.error(f"Error downloading {url}: {e}")
-        return
+        downloader.download(url, output_path)
+    finally:
+        downloader.close()
@@ -0,0 +1,136 @@
+import os, re, functools, threading, typing, unicodedata
+
+# Characters replaced in file names. Windows has the most restrictions, so it is the base,
+# plus a few characters that confuse shells and media players and the control characters.
+INVALID_CHARS: typing.Final[str] = (
+    r'<>:"/\|?*.#@ºª!$%¨¬´`{}^~[]'
+    + "".join(chr(i) for i in range(32))
+    + "".join(chr(i) for i in range(0x7F, 0xA0))
+)
+# Names Windows refuses whatever their extension.
+RESERVED_NAMES: typing.Final[frozenset[str]] = frozenset(
+    ["CON", "PRN", "AUX", "NUL"]
+    + [f"COM{i}" for i in range(1, 10)]
+    + [f"LPT{i}" for i in range(1, 10)]
+)
+# Longest file name, in bytes, most filesystems accept.
+MAX_LENGTH: typing.Final[int] = 255
+
+
+@functools.cache
+def _rules(replacement: str) -> tuple[dict[int, str], re.Pattern[str]]:
+    """
+    Builds, once per replacement, the translation table and the pattern collapsing runs
+    of the replacement.
+    """
+    table = str.maketrans({char: replacement for char in INVALID_CHARS})
+    return table, re.compile(f"(?:{re.escape(replacement)})+")
+
+
+def sanitize(name: str, replacement: str = "_", max_length: int = MAX_LENGTH) -> str:
+    """
+    Makes a file name, without extension, valid across Windows, Linux and macOS.
+
+    The name is normalized to NFC, keeping letters of every script, invalid characters
+    become `replacement`, leading and trailing spaces are removed and the name is cut to
+    `max_length` bytes of UTF-8. Slashes are replaced too, so a title never adds a folder.
+
+    Args:
+        name (str): The name to sanitize, without extension.
+        replacement (str): What invalid characters are replaced with.
+        max_length (int): Longest name returned, in bytes of UTF-8.
+
+    Returns:
+        str: The sanitized name, `replacement` if nothing is left of it.
+    """
+    table, repeats = _rules(replacement)
+    name = unicodedata.normalize("NFC", name)
+    name = repeats.sub(replacement, name.translate(table)).strip(" ")
+    if os.name == "nt" and name.upper() in RESERVED_NAMES:
+        name = f"{name}{replacement}"
+    return _truncate(name, max_length) if len(name) > 0 else replacement
+
+
+def _truncate(name: str, max_length: int) -> str:
+    """
+    Cuts a name to `max_length` bytes of UTF-8, never in the middle of a character.
+    """
+    return name.encode("utf-8")[:max_length].decode("utf-8", "ignore")
+
+
+class FileNameAllocator:
+    """
+    Hands out sanitized file names that no other file uses.
+
+    A name already taken gets a " (2)", " (3)"... suffix before the extension. Names are
+    compared case insensitively, so a library copied to Windows or macOS keeps them
+    distinct. Allocating the tracks of a playlist in playlist order gives the same names
+    on every run. Thread safe.
+    """
+
+    def __init__(
+        self, extension: str, taken: typing.Iterable[str] = (), replacement: str = "_"
+    ):
+        """
+        Initializes the FileNameAllocator.
+
+        Args:
+            extension (str): The extension of every name handed out, with its dot.
+            taken (typing.Iterable[str]): File names already in use, with extension.
+            replacement (str): What invalid characters are replaced with.
+        """
+        self.extension = extension
+        self.replacement = replacement
+        self._taken = {name.casefold() for name in taken}
+        # Next suffix number to try for each base name, so many tracks sharing a name
+        # do not probe every earlier suffix again.
+        self._numbers: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, name: str) -> typing.Iterator[str]:
+        """
+        Yields, without reserving them, the file names `allocate` picks from for a name,
+        in the order it tries them: the bare name, then " (2)", " (3)"... endlessly.
+
+        Args:
+            name (str): The wanted name, unsanitized and without extension.
+
+        Returns:
+            typing.Iterator[str]: The sanitized file names, with extension.
+        """
+        base = sanitize(name, self.replacement, MAX_LENGTH - len(self.extension.encode()))
+        number = 1
+        while True:
+            yield self._numbered(base, number)
+            number += 1
+
+    def allocate(self, name: str) -> str:
+        """
+        Reserves and returns a free file name.
+
+        Args:
+            name (str): The wanted name, unsanitized and without extension.
+
+        Returns:
+            str: The sanitized file name, with extension, suffixed when already taken.
+        """
+        base = sanitize(name, self.replacement, MAX_LENGTH - len(self.extension.encode()))
+        with self._lock:
+            file_name = base + self.extension
+            key = base.casefold()
+            number = self._numbers.get(key, 1)
+            while file_name.casefold() in self._taken:
+                number += 1
+                file_name = self._numbered(base, number)
+            self._numbers[key] = number
+            self._taken.add(file_name.casefold())
+            return file_name
+
+    def _numbered(self, base: str, number: int) -> str:
+        """
+        Returns the file name of a sanitized base name with its suffix number, 1 for none.
+        """
+        if number == 1:
+            return base + self.extension
+        suffix = f" ({number}){self.extension}"
+        return _truncate(base, MAX_LENGTH - len(suffix.encode())) + suffix
@@ -0,0 +1,254 @@
+import os, time, threading, contextlib, typing
+from pathlib import Path
+import utils
+
+# Upper bounds, in seconds, of the duration histogram buckets. Wide enough for a quick
+# tag write as well as a long fetch over a slow connection.
+DURATION_BUCKETS: typing.Final[tuple[float, ...]] = (
+    0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, like a Prometheus histogram. Not thread safe,
+    `Metrics` guards it.
+    """
+
+    def __init__(self, buckets: typing.Sequence[float]):
+        """
+        Initializes the Histogram.
+
+        Args:
+            buckets (typing.Sequence[float]): The sorted upper bounds of the buckets,
+                observations above the last one only count in the total.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """
+        Returns:
+            list[tuple[float, int]]: Each bucket bound with the observations at or below it.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class StageMetrics:
+    """
+    Durations, bytes and outcomes recorded for one stage of a run.
+    """
+
+    def __init__(self):
+        self.durations = Histogram(DURATION_BUCKETS)
+        self.outcomes: dict[str, int] = {}
+        self.bytes: int = 0
+        self.items: int = 0
+
+
+class Measurement:
+    """
+    Handed out by `Metrics.measure`, lets the measured code report what it produced.
+    """
+
+    def __init__(self):
+        self.bytes: int = 0
+        self.items: int = 1
+        self.excluded_seconds: float = 0.0
+
+    @contextlib.contextmanager
+    def exclude(self) -> typing.Iterator[None]:
+        """
+        Leaves the enclosed code out of the measured duration, e.g. time spent waiting on
+        another stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.excluded_seconds += time.perf_counter() - start
+
+
+class Metrics:
+    """
+    Thread safe per-stage timings of a run, written out as JSON and in the Prometheus
+    text format at the end of it.
+    """
+
+    def __init__(self, namespace: str):
+        """
+        Initializes the Metrics.
+
+        Args:
+            namespace (str): Prefix of the Prometheus metric names.
+        """
+        self.namespace = namespace
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages: dict[str, StageMetrics] = {}
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> typing.Iterator[Measurement]:
+        """
+        Times the enclosed code as one operation of a stage. It counts as "ok" unless it
+        raises, then as "error" and the error propagates.
+
+        Args:
+            stage (str): The stage name.
+
+        Returns:
+            typing.Iterator[Measurement]: Set its `bytes` and `items` to record them.
+        """
+        measurement = Measurement()
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield measurement
+            outcome = "ok"
+        finally:
+            seconds = time.perf_counter() - start - measurement.excluded_seconds
+            self.observe(stage, seconds, outcome, measurement)
+
+    def observe(
+        self,
+        stage: str,
+        seconds: float,
+        outcome: str,
+        measurement: Measurement | None = None,
+    ) -> None:
+        """
+        Records one operation of a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): How long it took.
+            outcome (str): How it ended, e.g. "ok" or "error".
+            measurement (Measurement | None): The bytes and items it produced.
+        """
+        with self._lock:
+            metrics = self._stages.get(stage)
+            if metrics is None:
+                metrics = self._stages[stage] = StageMetrics()
+            metrics.durations.observe(seconds)
+            metrics.outcomes[outcome] = metrics.outcomes.get(outcome, 0) + 1
+            if measurement is not None and outcome == "ok":
+                metrics.bytes += measurement.bytes
+                metrics.items += measurement.items
+
+    def to_json(self, exit_code: int) -> dict[str, typing.Any]:
+        """
+        Converts the metrics to a JSON serializable dictionary.
+
+        Args:
+            exit_code (int): The exit code of the run.
+
+        Returns:
+            dict[str, typing.Any]: The JSON representation of the metrics.
+        """
+        with self._lock:
+            stages = {}
+            for name, metrics in self._stages.items():
+                histogram = metrics.durations
+                stages[name] = {
+                    "count": histogram.count,
+                    "seconds": histogram.sum,
+                    "mean_seconds": histogram.sum / max(1, histogram.count),
+                    "outcomes": dict(metrics.outcomes),
+                    "bytes": metrics.bytes,
+                    "items": metrics.items,
+                    "buckets": {
+                        str(bound): count for bound, count in histogram.cumulative()
+                    },
+                }
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": time.perf_counter() - self._started,
+                "exit_code": exit_code,
+                "stages": stages,
+            }
+
+    def to_prometheus(self, exit_code: int) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format, for the node
+        exporter textfile collector.
+
+        Args:
+            exit_code (int): The exit code of the run.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        ns = self.namespace
+        lines = [
+            f"# TYPE {ns}_run_started_timestamp_seconds gauge",
+            f"{ns}_run_started_timestamp_seconds {self.started_at:.3f}",
+            f"# TYPE {ns}_run_duration_seconds gauge",
+            f"{ns}_run_duration_seconds {time.perf_counter() - self._started:.6f}",
+            f"# TYPE {ns}_run_exit_code gauge",
+            f"{ns}_run_exit_code {exit_code}",
+            f"# TYPE {ns}_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, metrics in stages:
+                histogram = metrics.durations
+                bucket = f"{ns}_stage_duration_seconds_bucket"
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{bucket}{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{bucket}{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(
+                    f'{ns}_stage_duration_seconds_sum{{stage="{name}"}} {histogram.sum:.6f}'
+                )
+                lines.append(
+                    f'{ns}_stage_duration_seconds_count{{stage="{name}"}} {histogram.count}'
+                )
+            lines.append(f"# TYPE {ns}_stage_operations_total counter")
+            for name, metrics in stages:
+                for outcome, count in sorted(metrics.outcomes.items()):
+                    labels = f'stage="{name}",outcome="{outcome}"'
+                    lines.append(f"{ns}_stage_operations_total{{{labels}}} {count}")
+            lines.append(f"# TYPE {ns}_stage_bytes_total counter")
+            for name, metrics in stages:
+                lines.append(f'{ns}_stage_bytes_total{{stage="{name}"}} {metrics.bytes}')
+            lines.append(f"# TYPE {ns}_stage_items_total counter")
+            for name, metrics in stages:
+                lines.append(f'{ns}_stage_items_total{{stage="{name}"}} {metrics.items}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: Path, prometheus_path: Path, exit_code: int) -> None:
+        """
+        Writes the JSON and Prometheus reports, each replaced atomically.
+
+        Args:
+            json_path (Path): Where to write the JSON report.
+            prometheus_path (Path): Where to write the Prometheus report.
+            exit_code (int): The exit code of the run.
+        """
+        utils.write_json_file(json_path, self.to_json(exit_code))
+        prometheus_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = prometheus_path.with_name(prometheus_path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus(exit_code))
+        os.replace(temp_path, prometheus_path)
@@ -0,0 +1,185 @@
+import threading, typing
+from logging import Logger
+from data.mp3 import Mp3
+from logic.worker_pool import WorkerPool
+import utils
+
+
+class Stage:
+    """
+    One step of the pipeline, moving Mp3 objects out of a single `Mp3.State`.
+
+    Each stage owns a bounded queue and its own pool of workers, so stages with different
+    bottlenecks (network, CPU, disk) run side by side instead of alternating.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        state: Mp3.State,
+        handler: typing.Callable[[Mp3], None],
+        worker_count: int,
+        queue_size: int,
+    ):
+        """
+        Initializes the Stage.
+
+        Args:
+            name (str): The name of the stage, used for threads, logs and stats.
+            state (Mp3.State): The state of the Mp3 objects this stage consumes.
+            handler (typing.Callable[[Mp3], None]): Advances an Mp3 to its next state.
+            worker_count (int): How many workers run this stage.
+            queue_size (int): How many Mp3 objects may wait for this stage.
+        """
+        self.name = name
+        self.state = state
+        self.handler = handler
+        self.worker_count = worker_count
+        self.queue_size = queue_size
+        self.pool: WorkerPool[Mp3] | None = None
+
+
+class Pipeline:
+    """
+    Moves Mp3 objects through a chain of stages until they reach `Mp3.State.DONE`.
+
+    After a stage handler returns, the Mp3 is routed to the stage registered for its new
+    state. A full downstream queue blocks the upstream worker, which keeps memory bounded.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        on_done: typing.Callable[[Mp3], None] | None = None,
+        on_failed: typing.Callable[[Mp3, Exception], None] | None = None,
+    ):
+        """
+        Initializes the Pipeline.
+
+        Args:
+            logger (Logger): The logger to use for logging.
+            on_done (typing.Callable[[Mp3], None] | None): Called once an Mp3 is done.
+            on_failed (typing.Callable[[Mp3, Exception], None] | None): Called when a stage
+                handler raises. The Mp3 leaves the pipeline.
+        """
+        self._logger = logger
+        self._on_done = on_done
+        self._on_failed = on_failed
+        self._stages: dict[Mp3.State, Stage] = {}
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    def add_stage(self, stage: Stage) -> None:
+        """
+        Registers a stage. Must be called before `start`.
+
+        Args:
+            stage (Stage): The stage to register.
+        """
+        self._stages[stage.state] = stage
+
+    def start(self) -> None:
+        """
+        Starts the workers of every stage.
+        """
+        for stage in self._stages.values():
+            stage.pool = WorkerPool(
+                stage.name,
+                stage.worker_count,
+                self._make_handler(stage),
+                self._logger,
+                stage.queue_size,
+                self._failed,
+            )
+            stage.pool.start()
+
+    def submit(self, mp3: Mp3) -> None:
+        """
+        Adds an Mp3 to the pipeline, entering at the stage for its current state.
+
+        Args:
+            mp3 (Mp3): The Mp3 object to process.
+        """
+        with self._idle:
+            self._in_flight += 1
+        self._route(mp3)
+
+    def join(self) -> None:
+        """
+        Blocks until every submitted Mp3 is done or has failed.
+        """
+        with self._idle:
+            while self._in_flight > 0:
+                self._idle.wait()
+
+    def stop(self) -> None:
+        """
+        Stops the workers of every stage.
+        """
+        for stage in self._stages.values():
+            if stage.pool is not None:
+                stage.pool.stop()
+                stage.pool = None
+
+    def describe(self) -> str:
+        """
+        Returns a one line summary of every stage's queue depth and throughput.
+        """
+        parts = []
+        for stage in self._stages.values():
+            pool = stage.pool
+            if pool is None:
+                continue
+            parts.append(
+                f"{stage.name}: depth={pool.depth}/{stage.queue_size} max={pool.max_depth} "
+                f"done={pool.processed} failed={pool.failed} "
+                f"rate={pool.throughput:.2f}/s busy={pool.busy_seconds:.1f}s"
+            )
+        return " | ".join(parts)
+
+    def _make_handler(self, stage: Stage) -> typing.Callable[[Mp3], None]:
+        """
+        Wraps a stage handler so its output is routed to the next stage. Records logged
+        while it runs carry the track and the stage.
+        """
+
+        def handle(mp3: Mp3) -> None:
+            with utils.log_context(track=mp3.url_id, stage=stage.name):
+                stage.handler(mp3)
+                if mp3.state is stage.state:
+                    raise Exception(f"Stage '{stage.name}' did not advance {mp3.url_id}")
+                self._route(mp3)
+
+        return handle
+
+    def _route(self, mp3: Mp3) -> None:
+        """
+        Sends an Mp3 to the stage for its current state, or finishes it when done.
+        """
+        if mp3.state is Mp3.State.DONE:
+            if self._on_done is not None:
+                self._on_done(mp3)
+            self._finish()
+            return
+        stage = self._stages.get(mp3.state)
+        if stage is None or stage.pool is None:
+            self._failed(mp3, Exception(f"No stage for state {mp3.state.name}"))
+            return
+        stage.pool.submit(mp3)
+
+    def _failed(self, mp3: Mp3, error: Exception) -> None:
+        """
+        Takes a failed Mp3 out of the pipeline.
+        """
+        if self._on_failed is not None:
+            self._on_failed(mp3, error)
+        self._finish()
+
+    def _finish(self) -> None:
+        """
+        Marks one Mp3 as having left the pipeline.
+        """
+        with self._idle:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
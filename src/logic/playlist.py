@@ -1,50 +1,252 @@
-import typing, json
+import typing, json, time, contextlib
 from pathlib import Path
 from logging import Logger
-from ytmusicapi import YTMusic
 from data.mp3 import Mp3
+from logic.rate_limit import RateLimiter, is_throttled
+
+# Bumped whenever the layout of the cached playlist file changes.
+CACHE_VERSION: typing.Final[int] = 3
 
 
 def scrap_playlist(
-    playlist_id: str, logger: Logger | None, playlist_path: Path
+    playlist_id: str,
+    logger: Logger | None,
+    playlist_path: Path,
+    max_age: float = 0,
+    force_refresh: bool = False,
 ) -> typing.List[Mp3]:
     """
     Scrapes a YouTube Music playlist to extract song information.
 
-    It first checks if the playlist data is already cached locally. If not, or if the
-    playlist ID has changed, it fetches the data from YouTube Music and caches it.
+    Same as `iter_playlist`, but waits for the whole playlist.
 
     Args:
         playlist_id (str): The ID of the YouTube Music playlist.
         logger (Logger | None): The logger to use for logging.
         playlist_path (Path): The path to the cached playlist data.
+        max_age (float): How many seconds the cached playlist stays fresh, 0 to always
+            fetch it again.
+        force_refresh (bool): Whether to fetch the playlist even when the cache is fresh.
 
     Returns:
         typing.List[Mp3]: A list of Mp3 objects representing the songs in the playlist.
     """
-    need_download = True
-    js = {}
-    if playlist_path.exists():
-        try:
-            with playlist_path.open("r", encoding="utf-8") as f:
-                js = json.load(f)
-                if js["id"] == playlist_id:
-                    need_download = False
-        except:
-            playlist_path.unlink(missing_ok=True)
-            need_download = True
-    if need_download:
-        ytmusic = YTMusic()
-        js = ytmusic.get_playlist(playlist_id)
-        with playlist_path.open("w", encoding="utf-8") as f:
-            json.dump(js, f, indent=2)
+    pages = iter_playlist(playlist_id, logger, playlist_path, max_age, force_refresh)
+    return [mp3 for page in pages for mp3 in page]
+
+
+def iter_playlist(
+    playlist_id: str,
+    logger: Logger | None,
+    playlist_path: Path,
+    max_age: float = 0,
+    force_refresh: bool = False,
+    page_size: int = 100,
+    client: typing.Any = None,
+    limiter: RateLimiter | None = None,
+) -> typing.Iterator[typing.List[Mp3]]:
+    """
+    Scrapes a YouTube Music playlist, yielding its songs as soon as they are known.
+
+    The cached copy is used while it is younger than `max_age`. Otherwise the playlist
+    is fetched again, compared with the cached tracks, and the cache is replaced by a
+    compact copy holding only the fields that are used. When there is no cache at all,
+    the first `page_size` tracks are fetched and yielded on their own first, so work on
+    them can start while the rest of the playlist is still being fetched, unless that
+    page already holds the whole playlist. A refresh skips that request, as the whole
+    playlist fetch would get those tracks again.
+
+    Args:
+        playlist_id (str): The ID of the YouTube Music playlist.
+        logger (Logger | None): The logger to use for logging.
+        playlist_path (Path): The path to the cached playlist data.
+        max_age (float): How many seconds the cached playlist stays fresh, 0 to always
+            fetch it again.
+        force_refresh (bool): Whether to fetch the playlist even when the cache is fresh.
+        page_size (int): How many tracks to fetch for the first page without a cache, 0
+            to fetch the whole playlist at once.
+        client (typing.Any): Anything with a `YTMusic.get_playlist` compatible method,
+            a new `Client` when None.
+        limiter (RateLimiter | None): Shared limits every request passes through.
+
+    Returns:
+        typing.Iterator[typing.List[Mp3]]: Lists of Mp3 objects, in playlist order, each
+            song appearing once.
+    """
+    cache = _read_cache(playlist_id, playlist_path)
+    if cache is not None and not force_refresh:
+        age = time.time() - cache["fetched_at"]
+        if age < max_age:
+            if logger is not None:
+                logger.debug("Using cached playlist '%s' (%.0fs old)", playlist_id, age)
+            yield _to_mp3s(cache["tracks"])
+            return
+
+    if client is None:
+        client = Client()
+    yielded: set[str] = set()
+    tracks: list[dict[str, typing.Any]] | None = None
+    if page_size > 0 and cache is None:
+        js = _get_playlist(client, limiter, playlist_id, page_size, logger)
+        first_page = compact_tracks(js)
+        yielded.update(track["id"] for track in first_page)
+        yield _to_mp3s(first_page)
+        if logger is not None:
+            logger.debug("Fetched first %d tracks of playlist '%s'", len(yielded), playlist_id)
+        fetched = len(js.get("tracks") or [])
+        if fetched < page_size or fetched >= (js.get("trackCount") or fetched + 1):
+            # The first page already is the whole playlist.
+            tracks = first_page
+        del js, first_page
+
+    if tracks is None:
+        tracks = compact_tracks(_get_playlist(client, limiter, playlist_id, None, logger))
+        yield _to_mp3s([track for track in tracks if track["id"] not in yielded])
+    if logger is not None:
+        cached_ids = {track["id"] for track in cache["tracks"]} if cache else set()
+        fetched_ids = {track["id"] for track in tracks}
+        logger.debug(
+            "Fetched playlist '%s': %d tracks, %d added, %d removed",
+            playlist_id,
+            len(tracks),
+            len(fetched_ids - cached_ids),
+            len(cached_ids - fetched_ids),
+        )
+    _write_cache(playlist_id, playlist_path, tracks)
+
+
+class Client:
+    """
+    A `YTMusic` created on the first request and reused by every later one, so repeated
+    fetches share its session. Nothing is imported until then, a run served from the
+    cache never loads ytmusicapi.
+    """
+
+    def __init__(self):
+        self._ytmusic: typing.Any = None
+
+    def get_playlist(
+        self, playlist_id: str, limit: int | None = 100
+    ) -> dict[str, typing.Any]:
+        """
+        Same as `YTMusic.get_playlist`.
+        """
+        if self._ytmusic is None:
+            from ytmusicapi import YTMusic
+
+            self._ytmusic = YTMusic()
+        return self._ytmusic.get_playlist(playlist_id, limit=limit)
+
+
+def compact_tracks(js: dict[str, typing.Any]) -> list[dict[str, typing.Any]]:
+    """
+    Keeps only the fields used from a `YTMusic.get_playlist` response.
+
+    Tracks without a video id (removed or unavailable videos) are dropped.
+
+    Args:
+        js (dict[str, typing.Any]): The raw playlist response.
+
+    Returns:
+        list[dict[str, typing.Any]]: One dict per track with id, title, artist, album,
+            duration in seconds (0 when unknown) and the URL of its largest thumbnail.
+    """
+    tracks = []
+    for item in js.get("tracks", []):
+        if not item.get("videoId"):
+            continue
+        artists = item.get("artists") or []
+        album = item.get("album")
+        thumbnails = item.get("thumbnails") or []
+        tracks.append(
+            {
+                "id": item["videoId"],
+                "title": item["title"],
+                "artist": artists[0]["name"] if len(artists) > 0 else "",
+                "album": album["name"] if album is not None else "",
+                "duration": int(item.get("duration_seconds") or 0),
+                "thumbnail": thumbnails[-1]["url"] if len(thumbnails) > 0 else "",
+            }
+        )
+    return tracks
+
+
+def _get_playlist(
+    client: typing.Any,
+    limiter: RateLimiter | None,
+    playlist_id: str,
+    limit: int | None,
+    logger: Logger | None = None,
+) -> dict[str, typing.Any]:
+    """
+    Calls `get_playlist` on the client through the rate limiter, reporting throttling to
+    it.
+    """
+    slot = limiter.slot() if limiter is not None else contextlib.nullcontext()
+    try:
+        with slot:
+            js = client.get_playlist(playlist_id, limit=limit)
+    except Exception as e:
+        if limiter is not None and is_throttled(e):
+            backoff = limiter.throttled()
+            if logger is not None:
+                logger.warning(
+                    "Throttled while fetching playlist '%s', backing off %.0fs",
+                    playlist_id,
+                    backoff,
+                )
+        raise
+    if limiter is not None:
+        limiter.succeeded()
+    return js
+
+
+def _read_cache(playlist_id: str, playlist_path: Path) -> dict[str, typing.Any] | None:
+    """
+    Reads the cached playlist, if it exists, belongs to the playlist and is readable.
+    """
+    if not playlist_path.exists():
+        return None
+    try:
+        with playlist_path.open("r", encoding="utf-8") as f:
+            js = json.load(f)
+        if js.get("version") == CACHE_VERSION and js["id"] == playlist_id:
+            return js
+    except Exception:
+        pass
+    playlist_path.unlink(missing_ok=True)
+    return None
+
+
+def _write_cache(
+    playlist_id: str, playlist_path: Path, tracks: list[dict[str, typing.Any]]
+) -> None:
+    """
+    Writes the compact playlist cache.
+    """
+    playlist_path.parent.mkdir(parents=True, exist_ok=True)
+    js = {
+        "version": CACHE_VERSION,
+        "id": playlist_id,
+        "fetched_at": time.time(),
+        "tracks": tracks,
+    }
+    with playlist_path.open("w", encoding="utf-8") as f:
+        json.dump(js, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _to_mp3s(tracks: list[dict[str, typing.Any]]) -> typing.List[Mp3]:
+    """
+    Builds the Mp3 objects for the cached tracks.
+    """
     mp3s = []
-    if "tracks" not in js:
-        return mp3s
-    for item in js["tracks"]:
-        mp3 = Mp3(item["videoId"], item["title"])
-        mp3.artist = item["artists"][0]["name"]
-        if item["album"] is not None:
-            mp3.album = item["album"]["name"]
+    for track in tracks:
+        mp3 = Mp3(track["id"], track["title"])
+        mp3.artist = track["artist"]
+        if len(track["album"]) > 0:
+            mp3.album = track["album"]
+        if len(track["thumbnail"]) > 0:
+            mp3.thumbnail_url = track["thumbnail"]
+        mp3.duration_seconds = track["duration"]
         mp3s.append(mp3)
     return mp3s
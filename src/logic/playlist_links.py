@@ -0,0 +1,37 @@
+import os
+from pathlib import Path
+from logging import Logger
+import utils
+
+
+def sync_playlist_folder(logger: Logger, folder: Path, files: list[Path]) -> None:
+    """
+    Makes a playlist folder hold exactly one link to each of the given files.
+
+    Missing links are created and entries no longer part of the playlist are removed. The
+    folder only ever holds links, so removing from it never deletes the stored track.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        folder (Path): The playlist folder.
+        files (list[Path]): The stored files that belong to the playlist.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    wanted = {file.name: file for file in files}
+    with os.scandir(folder) as entries:
+        existing = {entry.name for entry in entries if not entry.is_dir()}
+    for name in existing - wanted.keys():
+        (folder / name).unlink(missing_ok=True)
+    created = 0
+    for name in wanted.keys() - existing:
+        try:
+            utils.link_file(wanted[name], folder / name)
+            created += 1
+        except OSError as e:
+            logger.error("Failed to link '%s' into '%s': %s", wanted[name], folder, e)
+    logger.debug(
+        "Playlist folder '%s': %d links created, %d removed",
+        folder,
+        created,
+        len(existing - wanted.keys()),
+    )
@@ -1,53 +1,323 @@
-class ProgressBar:
+import sys, time, threading, collections, typing
+
+
+class _Fetch:
     """
-    A simple progress bar for console applications.
+    A download in progress, as last reported by its worker.
     """
 
-    def __init__(self, total: float, bar_length: int = 50):
+    def __init__(self, label: str, downloaded: int, total: int | None):
+        self.label = label
+        # Bytes already on disk when the download started, e.g. a resumed .part file.
+        self.base = downloaded
+        self.downloaded = downloaded
+        self.total = total
+
+
+class TransferProgress:
+    """
+    Console progress of downloads running on several workers, drawn by its own thread.
+
+    Workers only record numbers under a lock, so reporting costs the same whatever the
+    number of progress events. A single thread redraws at most `refresh_rate` times a
+    second: a summary line with the files done, the bytes per second of the last
+    `window` seconds and an ETA from the bytes left, then one line per running download.
+    Bytes left are estimated from the sizes reported by yt-dlp, files not started yet
+    counting as the average size seen so far. When the output is not a terminal only the
+    summary line is printed, every `log_interval` seconds.
+
+    Anything else printed to the same output while the progress is shown must go through
+    `write`, e.g. by handing the TransferProgress to a logging handler as its stream, so
+    it is printed above the progress instead of being drawn over.
+    """
+
+    def __init__(
+        self,
+        stream: typing.TextIO | None = None,
+        refresh_rate: float = 4.0,
+        bar_length: int = 30,
+        window: float = 10.0,
+        max_fetch_lines: int = 8,
+        log_interval: float = 10.0,
+    ):
         """
-        Initializes the ProgressBar.
+        Initializes the TransferProgress.
 
         Args:
-            total (float): The total value for the progress bar.
+            stream (typing.TextIO | None): Where to draw, `sys.stdout` if None.
+            refresh_rate (float): Most redraws per second.
             bar_length (int): The length of the progress bar in characters.
+            window (float): Seconds of history the throughput is averaged over.
+            max_fetch_lines (int): Most downloads shown, one line each.
+            log_interval (float): Seconds between summary lines when not on a terminal.
         """
-        self.total = total
+        self._stream = stream if stream is not None else sys.stdout
+        self._interactive = self._stream.isatty()
+        self._interval = 1.0 / refresh_rate if self._interactive else log_interval
         self.bar_length = bar_length
-        self.current: float = 0
+        self.window = window
+        self.max_fetch_lines = max_fetch_lines
+        self._lock = threading.Lock()
+        self._phase = ""
+        self._files_total = 0
+        self._files_done = 0
+        # Files that still have to be downloaded, not counting the running downloads.
+        self._fetch_pending = 0
+        self._fetches: dict[str, _Fetch] = {}
+        self._fetched_count = 0
+        self._fetched_bytes = 0
+        # Bytes downloaded during this run, resumed ones excluded, for the throughput.
+        self._transferred = 0
+        self._samples: collections.deque[tuple[float, int]] = collections.deque()
+        self._dirty = True
+        # Guards the output, shared by the drawing thread and `write`.
+        self._output_lock = threading.Lock()
+        self._drawn: list[str] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, phase: str) -> None:
+        """
+        Starts the drawing thread. It can be started again once stopped.
+
+        Args:
+            phase (str): What the application is doing, shown first.
+        """
+        self.set_phase(phase)
+        if self._thread is None:
+            self._stop.clear()
+            with self._lock:
+                self._samples.append((time.monotonic(), self._transferred))
+            self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+            self._thread.start()
+
+    def stop(self, phase: str = "Done") -> None:
+        """
+        Stops the drawing thread after a last redraw. Does nothing if not started.
 
-    def update(self, increment: float, prefix: str) -> None:
+        Args:
+            phase (str): What to show as the final phase.
         """
-        Updates the progress bar with a given increment.
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.set_phase(phase)
+        self._draw(time.monotonic(), final=True)
 
+    def set_phase(self, phase: str) -> None:
+        """
         Args:
-            increment (float): The value to increment the progress bar by.
-            prefix (str): A prefix to display before the progress bar.
+            phase (str): What the application is doing, shown first.
         """
-        self.current += increment
-        self._update_progress_bar(self.current, self.total, self.bar_length, prefix)
+        with self._lock:
+            self._phase = phase
+            self._dirty = True
 
-    def done(self, prefix: str):
+    def add_file(self, needs_fetch: bool) -> None:
         """
-        Marks the progress bar as done.
+        Counts a file handed to the pipeline.
 
         Args:
-            prefix (str): A prefix to display before the progress bar.
+            needs_fetch (bool): Whether its audio still has to be downloaded.
         """
-        self._update_progress_bar(self.total, self.total, self.bar_length, prefix)
+        with self._lock:
+            self._files_total += 1
+            if needs_fetch:
+                self._fetch_pending += 1
+            self._dirty = True
 
-    def _update_progress_bar(
-        self, current: float, total: float, bar_length: int = 50, prefix: str = ""
+    def file_done(self) -> None:
+        """
+        Counts a file that went through the whole pipeline.
+        """
+        with self._lock:
+            self._files_done += 1
+            self._dirty = True
+
+    def file_failed(self, key: str, while_fetching: bool) -> None:
+        """
+        Forgets a file that left the pipeline on an error.
+
+        Args:
+            key (str): The key its download was reported with.
+            while_fetching (bool): Whether it failed before its audio was downloaded.
+        """
+        with self._lock:
+            self._files_total -= 1
+            if while_fetching and self._fetches.pop(key, None) is None:
+                self._fetch_pending -= 1
+            self._dirty = True
+
+    def fetch_progress(
+        self, key: str, label: str, downloaded: int, total: int | None
     ) -> None:
-        """Display a progress bar in the console"""
-        current = min(current, total)
-        percent = (current / total) * 100
-        filled_length = int(round(bar_length * current // total))
-        bar = "█" * filled_length + "-" * (bar_length - filled_length)
-
-        print(
-            f"\r{prefix[:20].rjust(20)} |{bar}| {f'{percent:.2f}'.rjust(6)}% Complete",
-            end="\r",
-        )
-
-        if current == total:
-            print()
+        """
+        Records how far a download got, called from the yt-dlp progress hook.
+
+        Args:
+            key (str): Identifies the download, e.g. the video id.
+            label (str): What to show for it.
+            downloaded (int): Bytes downloaded so far, resumed ones included.
+            total (int | None): Size of the download, None if unknown.
+        """
+        with self._lock:
+            fetch = self._fetches.get(key)
+            if fetch is None:
+                self._fetches[key] = _Fetch(label, downloaded, total)
+                self._fetch_pending = max(0, self._fetch_pending - 1)
+            else:
+                self._transferred += max(0, downloaded - fetch.downloaded)
+                fetch.downloaded = downloaded
+                fetch.total = total if total is not None else fetch.total
+            self._dirty = True
+
+    def fetch_done(self, key: str) -> None:
+        """
+        Records a finished download.
+
+        Args:
+            key (str): The key its progress was reported with.
+        """
+        with self._lock:
+            fetch = self._fetches.pop(key, None)
+            if fetch is None:
+                self._fetch_pending = max(0, self._fetch_pending - 1)
+                return
+            self._fetched_count += 1
+            self._fetched_bytes += max(fetch.downloaded, fetch.total or 0)
+            self._dirty = True
+
+    def _run(self) -> None:
+        """
+        Redraws whenever something changed, at most once per interval, until stopped.
+        """
+        while not self._stop.wait(self._interval):
+            self._draw(time.monotonic())
+
+    def _draw(self, now: float, final: bool = False) -> None:
+        """
+        Draws the current progress, if anything changed since the last draw.
+        """
+        with self._lock:
+            if not self._dirty and not final:
+                return
+            self._dirty = False
+            lines = self._render(now)
+        with self._output_lock:
+            if not self._interactive:
+                self._stream.write(lines[0] + "\n")
+                self._stream.flush()
+                return
+            output = self._clear() + "\n".join(lines)
+            if final:
+                output += "\n"
+            self._stream.write(output)
+            self._stream.flush()
+            self._drawn = [] if final else lines
+
+    def write(self, text: str) -> int:
+        """
+        Prints text above the progress, which is drawn again below it.
+
+        Args:
+            text (str): The text to print, usually whole lines.
+
+        Returns:
+            int: The length of the text.
+        """
+        with self._output_lock:
+            if len(self._drawn) == 0:
+                self._stream.write(text)
+                return len(text)
+            output = self._clear() + text
+            if text.endswith("\n"):
+                output += "\n".join(self._drawn)
+            else:
+                self._drawn = []
+            self._stream.write(output)
+            return len(text)
+
+    def flush(self) -> None:
+        """
+        Flushes the output.
+        """
+        self._stream.flush()
+
+    def _clear(self) -> str:
+        """
+        Returns the escape codes erasing the progress drawn last, called with the output
+        lock held.
+        """
+        if len(self._drawn) == 0:
+            return ""
+        output = "\r"
+        if len(self._drawn) > 1:
+            output += f"\x1b[{len(self._drawn) - 1}F"
+        return output + "\x1b[J"
+
+    def _render(self, now: float) -> list[str]:
+        """
+        Builds the lines to draw, called with the lock held.
+        """
+        self._samples.append((now, self._transferred))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        first_time, first_bytes = self._samples[0]
+        rate = (self._transferred - first_bytes) / (now - first_time) if now > first_time else 0
+
+        known = [fetch.total for fetch in self._fetches.values() if fetch.total]
+        if self._fetched_count > 0:
+            average = self._fetched_bytes / self._fetched_count
+        elif len(known) > 0:
+            average = sum(known) / len(known)
+        else:
+            average = 0
+        done_bytes = self._fetched_bytes
+        left_bytes = self._fetch_pending * average
+        for fetch in self._fetches.values():
+            done_bytes += fetch.downloaded
+            left_bytes += max(0, (fetch.total or average) - fetch.downloaded)
+
+        if done_bytes + left_bytes > 0:
+            fraction = done_bytes / (done_bytes + left_bytes)
+        else:
+            fraction = self._files_done / self._files_total if self._files_total else 0
+        filled = int(self.bar_length * fraction)
+        bar = "█" * filled + "-" * (self.bar_length - filled)
+        eta = _format_duration(left_bytes / rate) if rate > 0 and average > 0 else "--:--"
+        lines = [
+            f"{self._phase[:20].rjust(20)} |{bar}| {fraction * 100:5.1f}% "
+            f"{self._files_done}/{self._files_total} files "
+            f"{_format_bytes(rate)}/s ETA {eta}"
+        ]
+        if self._interactive:
+            for fetch in list(self._fetches.values())[: self.max_fetch_lines]:
+                size = _format_bytes(fetch.total) if fetch.total else "?"
+                lines.append(
+                    f"  {fetch.label[:40]:40} {_format_bytes(fetch.downloaded):>9} / {size}"
+                )
+        return lines
+
+
+def _format_bytes(amount: float) -> str:
+    """
+    Formats a byte count with a binary unit, e.g. "3.2 MB".
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if amount < 1024:
+            return f"{amount:.1f} {unit}"
+        amount /= 1024
+    return f"{amount:.1f} TB"
+
+
+def _format_duration(seconds: float) -> str:
+    """
+    Formats seconds as M:SS or H:MM:SS.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
@@ -0,0 +1,235 @@
+import re, threading, time, contextlib, typing
+
+# "HTTP Error 429" from urllib and yt-dlp, "HTTP 429" from ytmusicapi.
+_HTTP_429: typing.Final[re.Pattern[str]] = re.compile(r"\bhttp(?: error)? 429\b")
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket, refilled at a fixed rate up to its capacity.
+
+    Callers may take more tokens than are available; the bucket then goes into debt and
+    the caller sleeps until it is paid back, which keeps the long term rate exact even for
+    large amounts such as byte counts.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        Initializes the TokenBucket.
+
+        Args:
+            rate (float): Tokens added per second, 0 or less disables the bucket.
+            capacity (float | None): Most tokens the bucket holds, one second worth if None.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """
+        Takes tokens from the bucket, sleeping until they are available.
+
+        Args:
+            amount (float): How many tokens to take.
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """
+    A semaphore whose number of slots can shrink and grow while in use.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        """
+        Initializes the AdaptiveLimit, starting with every slot available.
+
+        Args:
+            maximum (int): The most slots ever handed out at once.
+            minimum (int): The fewest slots the limit shrinks to.
+        """
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = self.maximum
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """
+        Takes a slot, waiting while every slot of the current limit is taken.
+        """
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        """
+        Gives a slot back.
+        """
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def decrease(self) -> int:
+        """
+        Halves the limit, down to the minimum.
+
+        Returns:
+            int: The new limit.
+        """
+        with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            return self.limit
+
+    def increase(self) -> int:
+        """
+        Raises the limit by one slot, up to the maximum.
+
+        Returns:
+            int: The new limit.
+        """
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1)
+            self._condition.notify()
+            return self.limit
+
+
+class RateLimiter:
+    """
+    Shared limits for every request made to YouTube.
+
+    Combines a requests per second bucket, a bytes per second bucket and an adaptive
+    concurrency limit. When a request is throttled the concurrency is halved and new
+    requests pause for an exponentially growing backoff; after enough successes in a row
+    the concurrency grows back one slot at a time.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        bytes_per_second: float,
+        max_concurrency: int,
+        backoff_base: float = 2.0,
+        backoff_max: float = 120.0,
+        grow_after: int = 5,
+    ):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            requests_per_second (float): Request rate, 0 for unlimited.
+            bytes_per_second (float): Download rate, 0 for unlimited.
+            max_concurrency (int): Most requests in flight at once.
+            backoff_base (float): Pause in seconds after the first throttled request.
+            backoff_max (float): Longest pause in seconds.
+            grow_after (int): Successes in a row needed to raise the concurrency by one.
+        """
+        self.requests = TokenBucket(requests_per_second)
+        self.bytes = TokenBucket(bytes_per_second)
+        self.concurrency = AdaptiveLimit(max_concurrency)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.grow_after = grow_after
+        self.throttled_count: int = 0
+        self._lock = threading.Lock()
+        self._backoff = 0.0
+        self._resume_at = 0.0
+        self._successes = 0
+
+    @contextlib.contextmanager
+    def slot(self) -> typing.Iterator[None]:
+        """
+        Holds a concurrency slot and a request token for the duration of a request,
+        after waiting out any backoff.
+        """
+        self._wait_backoff()
+        self.concurrency.acquire()
+        try:
+            self.requests.acquire()
+            yield
+        finally:
+            self.concurrency.release()
+
+    def consume_bytes(self, amount: int) -> None:
+        """
+        Accounts for downloaded bytes, sleeping to keep under the byte rate.
+
+        Args:
+            amount (int): How many bytes were just downloaded.
+        """
+        if amount > 0:
+            self.bytes.acquire(amount)
+
+    def succeeded(self) -> None:
+        """
+        Records a request that was not throttled.
+        """
+        with self._lock:
+            self._backoff = 0.0
+            self._successes += 1
+            if self._successes < self.grow_after:
+                return
+            self._successes = 0
+        self.concurrency.increase()
+
+    def throttled(self) -> float:
+        """
+        Records a throttled request, shrinking the concurrency and pausing new requests.
+
+        Returns:
+            float: The pause in seconds before new requests start.
+        """
+        with self._lock:
+            self.throttled_count += 1
+            self._successes = 0
+            self._backoff = min(
+                self.backoff_max, self._backoff * 2 if self._backoff > 0 else self.backoff_base
+            )
+            self._resume_at = max(self._resume_at, time.monotonic() + self._backoff)
+            backoff = self._backoff
+        self.concurrency.decrease()
+        return backoff
+
+    def _wait_backoff(self) -> None:
+        """
+        Sleeps until the current backoff, if any, is over.
+        """
+        while True:
+            with self._lock:
+                wait = self._resume_at - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+def is_throttled(error: BaseException) -> bool:
+    """
+    Tells whether an error means the server is rate limiting us.
+
+    Args:
+        error (BaseException): The error raised by a request.
+
+    Returns:
+        bool: True for HTTP 429 and similar throttling responses.
+    """
+    if getattr(error, "code", None) == 429 or getattr(error, "status", None) == 429:
+        return True
+    message = str(error).lower()
+    # Only a status line, "429" alone also shows up in ids, sizes and paths.
+    if _HTTP_429.search(message) is not None:
+        return True
+    return any(
+        marker in message for marker in ("too many requests", "rate limit", "rate-limit")
+    )
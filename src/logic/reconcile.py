@@ -0,0 +1,36 @@
+import os, typing
+from pathlib import Path
+
+
+class FileEntry(typing.NamedTuple):
+    """
+    Size and modification time of a file found by `scan_folder`.
+    """
+
+    size: int
+    mtime: float
+
+
+def scan_folder(folder: Path) -> dict[str, FileEntry]:
+    """
+    Lists the files directly inside a folder with a single directory scan.
+
+    `os.scandir` returns the file type with each entry, so only regular files need an
+    extra stat call for their size and modification time, and none needs a separate
+    existence check.
+
+    Args:
+        folder (Path): The folder to scan, a missing folder counts as empty.
+
+    Returns:
+        dict[str, FileEntry]: The files in the folder, keyed by file name.
+    """
+    index: dict[str, FileEntry] = {}
+    if not folder.is_dir():
+        return index
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                index[entry.name] = FileEntry(stat.st_size, stat.st_mtime)
+    return index
@@ -0,0 +1,97 @@
+import time
+from data.mp3 import Mp3
+
+
+class RetryScheduler:
+    """
+    Decides when tracks whose processing failed are tried again.
+
+    A failed track is moved to `Mp3.State.FAILED`, remembering the state it failed in, and
+    becomes eligible again after an exponential backoff. Tracks that failed too often stay
+    failed until their attempts are reset, see `reset`.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, max_attempts: int):
+        """
+        Initializes the RetryScheduler.
+
+        Args:
+            base_delay (float): Seconds to wait after the first failure.
+            max_delay (float): Longest wait in seconds between two attempts.
+            max_attempts (int): Failed attempts after which a track is given up on.
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def fail(self, mp3: Mp3, error: Exception, now: float | None = None) -> None:
+        """
+        Records a failed attempt on a track and schedules its next one.
+
+        Args:
+            mp3 (Mp3): The track that failed.
+            error (Exception): Why it failed.
+            now (float | None): The current time, `time.time()` if None.
+        """
+        now = time.time() if now is None else now
+        if mp3.state is not Mp3.State.FAILED:
+            mp3.failed_state = mp3.state
+        mp3.state = Mp3.State.FAILED
+        mp3.attempts += 1
+        mp3.last_error = str(error)
+        delay = min(self.max_delay, self.base_delay * 2 ** (mp3.attempts - 1))
+        mp3.next_attempt_at = now + delay
+
+    def gave_up(self, mp3: Mp3) -> bool:
+        """
+        Args:
+            mp3 (Mp3): A failed track.
+
+        Returns:
+            bool: True when the track failed too often to be tried again.
+        """
+        return mp3.attempts >= self.max_attempts
+
+    def is_due(self, mp3: Mp3, now: float | None = None) -> bool:
+        """
+        Args:
+            mp3 (Mp3): A failed track.
+            now (float | None): The current time, `time.time()` if None.
+
+        Returns:
+            bool: True when the track may be tried again now.
+        """
+        now = time.time() if now is None else now
+        return not self.gave_up(mp3) and mp3.next_attempt_at <= now
+
+    def resume(self, mp3: Mp3) -> None:
+        """
+        Moves a failed track back to the state it failed in, ready to be processed.
+
+        Args:
+            mp3 (Mp3): A failed track.
+        """
+        mp3.state = mp3.failed_state if mp3.failed_state is not None else Mp3.State.CREATED
+        mp3.failed_state = None
+
+    def reset(self, mp3: Mp3) -> None:
+        """
+        Forgets the failed attempts of a track, so it is tried again right away, even if
+        it was given up on.
+
+        Args:
+            mp3 (Mp3): A failed track.
+        """
+        mp3.attempts = 0
+        mp3.next_attempt_at = 0.0
+
+    def succeeded(self, mp3: Mp3) -> None:
+        """
+        Clears the retry bookkeeping of a track that got done.
+
+        Args:
+            mp3 (Mp3): The finished track.
+        """
+        mp3.attempts = 0
+        mp3.last_error = ""
+        mp3.next_attempt_at = 0.0
@@ -0,0 +1,93 @@
+import subprocess
+from logging import Logger
+from pathlib import Path
+
+# ffmpeg audio arguments for each output format. The passthrough formats try a plain
+# stream copy first and only encode when the fetched stream has another codec.
+ENCODE_ARGS: dict[str, list[str]] = {
+    "mp3": ["-codec:a", "libmp3lame", "-b:a", "192k"],
+    "opus": ["-codec:a", "libopus", "-b:a", "160k"],
+    "m4a": ["-codec:a", "aac", "-b:a", "192k"],
+}
+COPY_FORMATS: set[str] = {"opus", "m4a"}
+# Formats whose ffmpeg muxer can embed a cover image as an attached picture, an APIC
+# frame for mp3 and a covr atom for m4a. The Ogg muxer cannot, Opus files get theirs
+# from `update_tags.update_opus_tags`.
+COVER_FORMATS: set[str] = {"mp3", "m4a"}
+# ffmpeg metadata keys for the tags accepted by `update_tags.update_tags`, which the muxer
+# of each format maps to ID3 frames, Vorbis comments or iTunes atoms.
+METADATA_KEYS: dict[str, str] = {
+    "title": "title",
+    "artist": "artist",
+    "album": "album",
+    "album_artist": "album_artist",
+    "year": "date",
+    "track_number": "track",
+    "genre": "genre",
+    "composer": "composer",
+    "comment": "comment",
+    "lyrics": "lyrics",
+}
+
+
+def transcode(
+    logger: Logger,
+    source: Path,
+    output_path: Path,
+    audio_format: str,
+    ffmpeg: str = "ffmpeg",
+    tags: dict[str, str] | None = None,
+    cover: Path | None = None,
+) -> None:
+    """
+    Converts a fetched audio file into the output format with ffmpeg.
+
+    Each call runs its own ffmpeg process, so the number of callers bounds how many
+    cores are busy encoding. A partially written output is removed on failure. The tags
+    are written by the same ffmpeg run, so the output file is written only once.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        source (Path): The fetched audio file.
+        output_path (Path): The path to write the converted file to, must not exist.
+        audio_format (str): The output format, one of `ENCODE_ARGS`.
+        ffmpeg (str): The ffmpeg executable to run.
+        tags (dict[str, str] | None): Tags to embed, see `update_tags.update_mp3_tags`.
+            Metadata of the source is dropped either way.
+        cover (Path | None): A JPEG image to embed as the front cover, ignored by the
+            formats missing from `COVER_FORMATS`.
+    """
+    if output_path.exists():
+        logger.error("Output path already exists %s", output_path)
+        raise Exception(f"Output path already exists {output_path}")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    metadata_args = ["-map_metadata", "-1"]
+    for name, value in (tags or {}).items():
+        if name in METADATA_KEYS:
+            metadata_args += ["-metadata", f"{METADATA_KEYS[name]}={value}"]
+    if audio_format == "mp3":
+        # ID3v2.3 for maximum compatibility, like `update_tags.update_mp3_tags`.
+        metadata_args += ["-id3v2_version", "3"]
+    input_args = ["-i", str(source)]
+    stream_args = ["-vn"]
+    if cover is not None and audio_format in COVER_FORMATS:
+        input_args += ["-i", str(cover)]
+        stream_args = ["-map", "0:a", "-map", "1:v", "-codec:v", "copy"]
+        stream_args += ["-disposition:v", "attached_pic"]
+        stream_args += ["-metadata:s:v", "comment=Cover (front)"]
+    attempts = [ENCODE_ARGS[audio_format]]
+    if audio_format in COPY_FORMATS:
+        attempts.insert(0, ["-codec:a", "copy"])
+    for i, codec_args in enumerate(attempts):
+        command = [ffmpeg, "-nostdin", "-loglevel", "error", "-n", *input_args]
+        command += [*stream_args, *codec_args, *metadata_args, str(output_path)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode == 0:
+            logger.debug("Transcoded %s to %s", source, output_path)
+            return
+        output_path.unlink(missing_ok=True)
+        if i + 1 < len(attempts):
+            logger.debug("Stream copy of %s failed, encoding instead", source)
+    logger.error("Error transcoding %s: %s", source, result.stderr.strip())
+    raise Exception(f"ffmpeg failed on {source}: {result.stderr.strip()}")
@@ -1,22 +1,132 @@
 from pathlib import Path
 from logging import Logger
-from mutagen.mp3 import MP3
-from mutagen.id3 import (
-    ID3,
-    TIT2,  # type: ignore
-    TPE1,  # type: ignore
-    TALB,  # type: ignore
-    TDRC,  # type: ignore
-    TRCK,  # type: ignore
-    TCON,  # type: ignore
-    TCOM,  # type: ignore
-    COMM,  # type: ignore
-    USLT,  # type: ignore
-    TPE2,  # type: ignore
-)
-
-
-def update_mp3_tags(logger: Logger, file_path: Path, tags: dict[str, str]):
+
+# mutagen is imported by the writers that use it, so runs that tag nothing never load it.
+
+# Vorbis comment names for the supported tags, used by Opus files.
+VORBIS_KEYS = {
+    "title": "title",
+    "artist": "artist",
+    "album": "album",
+    "album_artist": "albumartist",
+    "year": "date",
+    "track_number": "tracknumber",
+    "genre": "genre",
+    "composer": "composer",
+    "comment": "comment",
+    "lyrics": "lyrics",
+}
+
+# iTunes atom names for the supported tags, used by M4A files.
+MP4_KEYS = {
+    "title": "\xa9nam",
+    "artist": "\xa9ART",
+    "album": "\xa9alb",
+    "album_artist": "aART",
+    "year": "\xa9day",
+    "genre": "\xa9gen",
+    "composer": "\xa9wrt",
+    "comment": "\xa9cmt",
+    "lyrics": "\xa9lyr",
+}
+
+
+def update_tags(
+    logger: Logger, file_path: Path, tags: dict[str, str], cover: Path | None = None
+):
+    """
+    Updates the tags of an audio file, picking the tag format from the file extension.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        file_path (Path): The path to the audio file, .mp3, .opus or .m4a.
+        tags (dict[str, str]): A dictionary of tags to update, see `update_mp3_tags`.
+        cover (Path | None): A JPEG image to embed as the front cover.
+    """
+    match file_path.suffix.lower():
+        case ".opus":
+            update_opus_tags(logger, file_path, tags, cover)
+        case ".m4a":
+            update_m4a_tags(logger, file_path, tags, cover)
+        case _:
+            update_mp3_tags(logger, file_path, tags, cover)
+
+
+def update_opus_tags(
+    logger: Logger, file_path: Path, tags: dict[str, str], cover: Path | None = None
+):
+    """
+    Updates the Vorbis comments of an Opus file.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        file_path (Path): The path to the Opus file.
+        tags (dict[str, str]): A dictionary of tags to update, see `update_mp3_tags`.
+        cover (Path | None): A JPEG image to embed as the front cover.
+    """
+    import base64
+    from mutagen.oggopus import OggOpus
+    from mutagen.flac import Picture
+
+    try:
+        audio = OggOpus(file_path)
+        for name, value in tags.items():
+            if name in VORBIS_KEYS:
+                audio[VORBIS_KEYS[name]] = [str(value)]
+        if cover is not None:
+            # Vorbis comments carry pictures as base64 encoded FLAC picture blocks.
+            picture = Picture()
+            picture.type = 3
+            picture.mime = "image/jpeg"
+            picture.desc = "Cover (front)"
+            picture.data = cover.read_bytes()
+            audio["metadata_block_picture"] = [
+                base64.b64encode(picture.write()).decode("ascii")
+            ]
+        audio.save()
+        logger.debug("Successfully updated tags for %s", file_path)
+
+    except Exception as e:
+        logger.error("Error updating %s: %s", file_path, e)
+        raise
+
+
+def update_m4a_tags(
+    logger: Logger, file_path: Path, tags: dict[str, str], cover: Path | None = None
+):
+    """
+    Updates the iTunes metadata of an M4A file.
+
+    Args:
+        logger (Logger): The logger to use for logging.
+        file_path (Path): The path to the M4A file.
+        tags (dict[str, str]): A dictionary of tags to update, see `update_mp3_tags`.
+        cover (Path | None): A JPEG image to embed as the front cover.
+    """
+    from mutagen.mp4 import MP4, MP4Cover
+
+    try:
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in tags.items():
+            if name in MP4_KEYS:
+                audio[MP4_KEYS[name]] = [str(value)]
+        if "track_number" in tags:
+            audio["trkn"] = [(int(tags["track_number"]), 0)]
+        if cover is not None:
+            audio["covr"] = [MP4Cover(cover.read_bytes(), imageformat=MP4Cover.FORMAT_JPEG)]
+        audio.save()
+        logger.debug("Successfully updated tags for %s", file_path)
+
+    except Exception as e:
+        logger.error("Error updating %s: %s", file_path, e)
+        raise
+
+
+def update_mp3_tags(
+    logger: Logger, file_path: Path, tags: dict[str, str], cover: Path | None = None
+):
     """
     Updates the ID3 tags of an MP3 file.
 
@@ -25,7 +135,24 @@ def update_mp3_tags(logger: Logger, file_path: Path, tags: dict[str, str]):
         file_path (Path): The path to the MP3 file.
         tags (dict[str, str]): A dictionary of tags to update.
             Supported tags: title, artist, album, album_artist, year, track_number, genre, composer, comment, lyrics.
+        cover (Path | None): A JPEG image to embed as the front cover.
     """
+    from mutagen.mp3 import MP3
+    from mutagen.id3 import (
+        ID3,
+        TIT2,  # type: ignore
+        TPE1,  # type: ignore
+        TALB,  # type: ignore
+        TDRC,  # type: ignore
+        TRCK,  # type: ignore
+        TCON,  # type: ignore
+        TCOM,  # type: ignore
+        COMM,  # type: ignore
+        USLT,  # type: ignore
+        TPE2,  # type: ignore
+        APIC,  # type: ignore
+    )
+
     try:
         # Load the MP3 file with ID3 tags
         audio = MP3(file_path, ID3=ID3)
@@ -57,10 +184,21 @@ def update_mp3_tags(logger: Logger, file_path: Path, tags: dict[str, str]):
             audio_tags.add(COMM(encoding=3, lang="eng", desc="", text=tags["comment"]))
         if "lyrics" in tags:
             audio_tags.add(USLT(encoding=3, lang="eng", desc="", text=tags["lyrics"]))
+        if cover is not None:
+            audio_tags.add(
+                APIC(
+                    encoding=3,
+                    mime="image/jpeg",
+                    type=3,  # Cover (front)
+                    desc="Cover (front)",
+                    data=cover.read_bytes(),
+                )
+            )
 
         # Save changes
         audio.save(v2_version=3)  # Save as ID3v2.3 for maximum compatibility
-        logger.debug(f"Successfully updated tags for {file_path}")
+        logger.debug("Successfully updated tags for %s", file_path)
 
     except Exception as e:
-        logger.error(f"Error updating {file_path}: {str(e)}")
+        logger.error("Error updating %s: %s", file_path, e)
+        raise
@@ -0,0 +1,127 @@
+import threading, queue, time, typing
+from logging import Logger
+
+T = typing.TypeVar("T")
+
+
+class WorkerPool(typing.Generic[T]):
+    """
+    A fixed size pool of worker threads consuming items from a shared queue.
+
+    Items are handed to `handler` one at a time by whichever worker is free. Exceptions
+    raised by the handler are logged and do not stop the worker. The pool keeps simple
+    counters so callers can observe its queue depth and throughput.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        worker_count: int,
+        handler: typing.Callable[[T], None],
+        logger: Logger,
+        queue_size: int = 0,
+        on_error: typing.Callable[[T, Exception], None] | None = None,
+    ):
+        """
+        Initializes the WorkerPool.
+
+        Args:
+            name (str): The name of the pool, used for thread names and logs.
+            worker_count (int): How many worker threads to run, at least 1.
+            handler (typing.Callable[[T], None]): Called with each submitted item.
+            logger (Logger): The logger to use for logging.
+            queue_size (int): Maximum number of waiting items, 0 for unbounded. When full,
+                `submit` blocks until a worker frees a slot.
+            on_error (typing.Callable[[T, Exception], None] | None): Called when the handler
+                raises, after the error is logged.
+        """
+        self.name = name
+        self.worker_count = max(1, worker_count)
+        self._handler = handler
+        self._on_error = on_error
+        self._logger = logger
+        self._queue: queue.Queue[T | None] = queue.Queue(queue_size)
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self.processed: int = 0
+        self.failed: int = 0
+        self.busy_seconds: float = 0.0
+        self.max_depth: int = 0
+        self.started_at: float = 0.0
+
+    @property
+    def depth(self) -> int:
+        """
+        The number of items waiting for a free worker.
+        """
+        return self._queue.qsize()
+
+    @property
+    def throughput(self) -> float:
+        """
+        Items processed per second since the pool was started.
+        """
+        elapsed = time.perf_counter() - self.started_at
+        return self.processed / elapsed if self.started_at > 0 and elapsed > 0 else 0.0
+
+    def start(self) -> None:
+        """
+        Starts the worker threads.
+        """
+        self.started_at = time.perf_counter()
+        for i in range(self.worker_count):
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        self._logger.debug("Started pool '%s' with %d workers", self.name, self.worker_count)
+
+    def submit(self, item: T) -> None:
+        """
+        Queues an item to be processed by the next free worker.
+
+        Args:
+            item (T): The item to process.
+        """
+        self._queue.put(item)
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def stop(self) -> None:
+        """
+        Stops the worker threads once the queued items are processed.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+    def _work(self) -> None:
+        """
+        Worker thread loop, runs the handler for each item until a stop marker arrives.
+        """
+        while True:
+            item = self._queue.get()
+            start = time.perf_counter()
+            ok = True
+            try:
+                if item is None:
+                    return
+                self._handler(item)
+            except Exception as e:
+                ok = False
+                self._logger.error("Worker in pool '%s' failed on %s: %s", self.name, item, e)
+                if self._on_error is not None:
+                    self._on_error(item, e)
+            finally:
+                if item is not None:
+                    with self._stats_lock:
+                        self.busy_seconds += time.perf_counter() - start
+                        if ok:
+                            self.processed += 1
+                        else:
+                            self.failed += 1
+                self._queue.task_done()
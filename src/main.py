@@ -1,9 +1,35 @@
-import logging
+import argparse, logging
 from app import App
 
 if __name__ == "__main__":
     """
     Main entry point of the application.
     """
-    app = App(logging.DEBUG)
-    app.run()
+    parser = argparse.ArgumentParser(description="Download YouTube Music playlists as mp3.")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="fetch the playlists again even if their cached copy is still fresh",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and poll the playlists for new songs until stopped",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="seconds between polls in watch mode, Config.WATCH_INTERVAL by default",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="retry the failed songs right away, even the ones given up on",
+    )
+    args = parser.parse_args()
+    app = App(logging.DEBUG, force_refresh=args.refresh, retry_failed=args.retry_failed)
+    if args.watch:
+        app.watch(args.interval)
+    else:
+        app.run()
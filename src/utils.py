@@ -1,28 +1,115 @@
-import logging, json, sys, typing, re, unicodedata, os
+import logging, logging.handlers, json, sys, typing, os, queue, atexit, contextlib, contextvars
 from pathlib import Path
 
+# Fields added to every record logged in the current thread or task, see `log_context`.
+_log_context: contextvars.ContextVar[dict[str, typing.Any]] = contextvars.ContextVar(
+    "log_context", default={}
+)
+# The background writer of each queued logger, by logger name.
+_listeners: dict[str, logging.handlers.QueueListener] = {}
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Copies the fields of `log_context` onto each record. Attached to the logger itself,
+    so it runs in the thread that logs and not in the background writer.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _log_context.get()
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line, with the `log_context` fields it was
+    logged with.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, typing.Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+        }
+        entry.update(getattr(record, "context", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records as they are, so their message is formatted by the background writer
+    and not by the thread that logs. The queue stays in the process, nothing is pickled.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+@contextlib.contextmanager
+def log_context(**fields: typing.Any) -> typing.Iterator[None]:
+    """
+    Adds fields, such as the track being processed, to every record logged inside the
+    block by the current thread. They show up in the JSON lines log.
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
 
 def setup_logger(
     name: str,
     file_path: Path,
     file_level: int = logging.WARNING,
     console_level: int = logging.INFO,
+    max_bytes: int = 0,
+    backup_count: int = 0,
+    json_lines: bool = False,
+    queued: bool = False,
+    console_stream: typing.TextIO | None = None,
 ) -> logging.Logger:
     """
     Sets up a logger with both file and console handlers.
 
+    When queued, logging a record only puts it on a queue and a single background thread
+    formats and writes it, so threads logging at the same time never wait on each other
+    or on the disk. The writer is flushed and stopped at exit.
+
     Args:
         name (str): The name of the logger.
         file_path (Path): The path to the log file.
         file_level (int): The logging level for the file handler.
         console_level (int): The logging level for the console handler.
+        max_bytes (int): Size at which the log file is rotated, 0 to never rotate.
+        backup_count (int): How many rotated log files are kept.
+        json_lines (bool): Whether the log file is written as JSON lines.
+        queued (bool): Whether records are written by a background thread.
+        console_stream (typing.TextIO | None): Where the console handler writes,
+            `sys.stdout` if None.
 
     Returns:
         logging.Logger: The configured logger.
     """
-    # Create logger
+    # Create logger, dropping the handlers of an earlier setup
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    for log_filter in list(logger.filters):
+        logger.removeFilter(log_filter)
+    # Records below both handler levels are dropped before their message is formatted.
+    logger.setLevel(min(file_level, console_level))
+    logger.addFilter(_ContextFilter())
 
     # Create formatter
     formatter = logging.Formatter(
@@ -31,23 +118,47 @@ def setup_logger(
 
     # Create file handler
     file_path.parent.mkdir(parents=True, exist_ok=True)
-    file_handler = logging.FileHandler(file_path, mode="a")
+    file_handler = logging.handlers.RotatingFileHandler(
+        file_path, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
     file_handler.setLevel(file_level)
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonLinesFormatter() if json_lines else formatter)
 
     # Create console handler (acts like print)
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(
+        console_stream if console_stream is not None else sys.stdout
+    )
     console_handler.setFormatter(formatter)
     console_handler.setLevel(console_level)
 
-    # Add both handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if queued:
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            records, file_handler, console_handler, respect_handler_level=True
+        )
+        _listeners[name] = listener
+        logger.addHandler(_DeferredQueueHandler(records))
+        listener.start()
+        atexit.register(_stop_listener, name, listener)
+    else:
+        # Add both handlers
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
 
-    logger.debug(f"Logger '{name}' set up with file '{file_path}'")
+    logger.debug("Logger '%s' set up with file '%s'", name, file_path)
     return logger
 
 
+def _stop_listener(name: str, listener: logging.handlers.QueueListener) -> None:
+    """
+    Writes the records still queued and stops the background writer at exit, unless the
+    logger was set up again since.
+    """
+    if _listeners.get(name) is listener:
+        del _listeners[name]
+        listener.stop()
+
+
 def read_json_file(file_path: Path) -> dict[str, typing.Any]:
     """
     Reads a JSON file and returns its content as a dictionary.
@@ -62,16 +173,27 @@ def read_json_file(file_path: Path) -> dict[str, typing.Any]:
         return json.load(file)
 
 
-def write_json_file(file_path: Path, data: dict[str, typing.Any]) -> None:
+def write_json_file(
+    file_path: Path, data: dict[str, typing.Any], indent: int | None = 2
+) -> None:
     """
     Writes a dictionary to a JSON file.
 
+    The data is written to a temporary file first and then renamed over the target, so
+    readers never see a half written file.
+
     Args:
         file_path (Path): The path to the JSON file.
         data (dict[str, typing.Any]): The dictionary to write to the JSON file.
+        indent (int | None): Indentation for pretty printing, None for compact output.
     """
-    with open(file_path, "w", encoding="utf-8") as file:
-        json.dump(data, file, indent=2)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=indent)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
 
 
 def grab_id_from_url(playlist_url: str) -> str:
@@ -97,67 +219,41 @@ def grab_id_from_url(playlist_url: str) -> str:
     return playlist_url
 
 
-def fix_file_name(file_name: Path, replacement: str = "_") -> Path:
+def link_file(source: Path, target: Path) -> None:
     """
-    Sanitize a filename to make it valid across different operating systems.
+    Makes `target` point at the same file as `source`, without copying its data.
+
+    A hardlink is tried first. Where it is not possible (another filesystem, no support)
+    a relative symlink is made instead.
 
     Args:
-        file_name (Path): The original filename to sanitize.
-        replacement (str): Character to replace invalid characters with (default: "_").
+        source (Path): The existing file.
+        target (Path): The path of the link to create.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        os.symlink(os.path.relpath(source, target.parent), target)
 
-    Returns:
-        Path: A sanitized filename that should work across Windows, Linux, and macOS.
-    """
-    name = file_name.stem
-    # Normalize unicode characters (convert accents to ASCII equivalents where possible)
-    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
-
-    # Define invalid characters for different OSes
-    # Windows has the most restrictions, so we'll use that as our base
-    invalid_chars: str = r'<>:"/\|?*.#@ºª!$%¨¬´`{}^~[]'
-    invalid_chars += "".join(chr(i) for i in range(32))  # ASCII control characters
-    invalid_chars += "\x7f"  # DEL character
-
-    # Replace invalid characters
-    for char in invalid_chars:
-        name = name.replace(char, replacement)
-
-    # Remove leading/trailing spaces and dots (Windows doesn't like these)
-    name = name.strip("")
-
-    # Replace consecutive replacement characters with a single one
-    name = re.sub(f"[{re.escape(replacement)}]+", replacement, name)
-    # Handle special cases (like reserved names on Windows)
-    if os.name == "nt":
-        reserved_names = (
-            "CON",
-            "PRN",
-            "AUX",
-            "NUL",
-            "COM1",
-            "COM2",
-            "COM3",
-            "COM4",
-            "COM5",
-            "COM6",
-            "COM7",
-            "COM8",
-            "COM9",
-            "LPT1",
-            "LPT2",
-            "LPT3",
-            "LPT4",
-            "LPT5",
-            "LPT6",
-            "LPT7",
-            "LPT8",
-            "LPT9",
-        )
-        if name.upper() in reserved_names:
-            name = f"{name}{replacement}"
-    # Truncate long filenames (255 chars is a safe limit for most filesystems)
-    max_length = 255
-    if len(name) > max_length:
-        # Keep the file extension if possible
-        name = name[: max_length - len(file_name.suffix)]
-    return Path(f"{name}{file_name.suffix}")
+
+def replace_with_hardlink(source: Path, target: Path) -> None:
+    """
+    Replaces `target` with a hardlink to `source`, atomically: readers see either the old
+    file or the link.
+
+    Args:
+        source (Path): The existing file.
+        target (Path): The path to replace, on the same filesystem as `source`.
+
+    Raises:
+        OSError: When the link cannot be made, `target` is left untouched.
+    """
+    temp_path = target.with_name(target.name + ".link")
+    temp_path.unlink(missing_ok=True)
+    os.link(source, temp_path)
+    try:
+        os.replace(temp_path, target)
+    except OSError:
+        temp_path.unlink(missing_ok=True)
+        raise
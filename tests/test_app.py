@@ -0,0 +1,81 @@
+import io, logging, threading
+from collections import deque
+from app import App
+from config import Config
+from data.mp3 import Mp3
+from data.state import State
+from logic import progress_bar, reconcile
+from logic.retry import RetryScheduler
+
+
+def _bare_app(disk_names: list[str]) -> App:
+    """
+    An App with only what naming files needs, over a download folder holding the given
+    files and an empty state.
+    """
+    app = App.__new__(App)
+    app._logger = logging.getLogger("test_app")
+    app._state = State()
+    app._disk_index = {name: reconcile.FileEntry(1, 0.0) for name in disk_names}
+    app._file_name_allocator = None
+    app._claimed_names = set()
+    app._file_names_lock = threading.Lock()
+    return app
+
+
+def _track(url_id: str, artist: str, title: str) -> Mp3:
+    mp3 = Mp3(url_id, title)
+    mp3.artist = artist
+    return mp3
+
+
+def test_lost_state_adopts_suffixed_names():
+    disk_names = ["A - T0.mp3"] + [f"A - T0 ({i}).mp3" for i in range(2, 13)]
+    app = _bare_app(disk_names)
+    tracks = [_track(f"v{i:02d}", "A", "T0") for i in range(12)]
+    for mp3 in tracks:
+        app._assign_file_path(mp3)
+
+    assert [mp3.file_path.name for mp3 in tracks] == disk_names
+    assert all(mp3.state is Mp3.State.DOWNLOADED for mp3 in tracks)
+    assert all(mp3.file_path.parent == Config.DOWNLOAD_FOLDER_PATH for mp3 in tracks)
+
+
+def test_new_track_past_the_adopted_ones_gets_a_new_name():
+    app = _bare_app(["A - T0.mp3", "A - T0 (2).mp3"])
+    tracks = [_track(f"v{i:02d}", "A", "T0") for i in range(3)]
+    for mp3 in tracks:
+        app._assign_file_path(mp3)
+
+    assert tracks[2].file_path.name == "A - T0 (3).mp3"
+    assert tracks[2].state is Mp3.State.CREATED
+
+
+def test_retry_failed_track_ends_done_without_its_error():
+    app = _bare_app([])
+    app._retry_failed = True
+    app._retry = RetryScheduler(30, 60, 2)
+    app._retries = []
+    app._retries_lock = threading.Lock()
+    app._process_queue = deque()
+    app._progress = progress_bar.TransferProgress(io.StringIO())
+    enqueued: list[Mp3] = []
+    app._enqueue = enqueued.append
+    mp3 = _track("v00", "A", "T0")
+    app._state.add(mp3)
+    for _ in range(2):
+        app._retry.fail(mp3, Exception("boom"))
+    assert app._retry.gave_up(mp3)
+
+    app._queue_pending_work()
+    app._submit_due_retries()
+    assert enqueued == [mp3]
+    assert mp3.state is Mp3.State.CREATED
+
+    mp3.file_path = Config.DOWNLOAD_FOLDER_PATH / "A - T0.mp3"
+    mp3.state = Mp3.State.DONE
+    app._file_done(mp3)
+    assert mp3.attempts == 0
+    assert mp3.last_error == ""
+    assert mp3.failed_state is None
+    assert mp3.next_attempt_at == 0.0
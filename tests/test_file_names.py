@@ -0,0 +1,41 @@
+from logic.file_names import FileNameAllocator, MAX_LENGTH, sanitize
+
+
+def test_sanitize_keeps_letters_of_every_script():
+    assert sanitize("宇多田ヒカル - First Love") == "宇多田ヒカル - First Love"
+    assert sanitize("Кино - Группа крови") == "Кино - Группа крови"
+    assert sanitize("فيروز - نسم علينا الهوى") == "فيروز - نسم علينا الهوى"
+    assert sanitize("Beyoncé / Halo?") == "Beyoncé _ Halo_"
+
+
+def test_sanitize_composes_accents():
+    assert sanitize("Beyoncé") == "Beyoncé"
+
+
+def test_sanitize_replaces_control_characters():
+    assert sanitize("A\x00B\x1fC\x85D") == "A_B_C_D"
+
+
+def test_sanitize_cuts_at_a_byte_length_without_splitting_characters():
+    name = sanitize("あ" * 200)
+    assert len(name.encode("utf-8")) <= MAX_LENGTH
+    assert name == "あ" * (MAX_LENGTH // 3)
+
+
+def test_non_latin_names_stay_distinct():
+    allocator = FileNameAllocator(".mp3")
+    names = [allocator.allocate(name) for name in ["Кино", "宇多田ヒカル", "فيروز"]]
+    assert names == ["Кино.mp3", "宇多田ヒカル.mp3", "فيروز.mp3"]
+
+
+def test_taken_names_get_a_suffix_compared_case_insensitively():
+    allocator = FileNameAllocator(".mp3", ["КИНО.mp3"])
+    assert allocator.allocate("кино") == "кино (2).mp3"
+    assert allocator.allocate("Кино") == "Кино (3).mp3"
+
+
+def test_candidates_follow_the_allocation_order():
+    allocator = FileNameAllocator(".mp3")
+    candidates = allocator.candidates("A - T0")
+    expected = [next(candidates) for _ in range(4)]
+    assert [allocator.allocate("A - T0") for _ in range(4)] == expected
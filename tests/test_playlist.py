@@ -0,0 +1,81 @@
+import typing
+from pathlib import Path
+import pytest
+from logic import playlist
+from logic.rate_limit import RateLimiter
+
+
+class _ThrottledClient:
+    """
+    A client whose every request is answered with HTTP 429.
+    """
+
+    def get_playlist(self, playlist_id: str, limit: int | None = 100) -> dict[str, typing.Any]:
+        raise Exception("HTTP Error 429: Too Many Requests")
+
+
+def test_throttled_playlist_fetch_backs_off_the_limiter(tmp_path: Path):
+    limiter = RateLimiter(0, 0, 4)
+    pages = playlist.iter_playlist(
+        "PLtest", None, tmp_path / "PLtest.json", client=_ThrottledClient(), limiter=limiter
+    )
+    with pytest.raises(Exception, match="429"):
+        next(pages)
+    assert limiter.throttled_count == 1
+    assert limiter.concurrency.limit < 4
+
+
+class _CountingClient:
+    """
+    A client serving a playlist of `count` tracks and counting its requests.
+    """
+
+    def __init__(self, count: int, track_count: int | None = None):
+        self.tracks = [
+            {"videoId": f"v{i:04d}", "title": f"T{i}", "artists": [{"name": "A"}]}
+            for i in range(count)
+        ]
+        self.track_count = count if track_count is None else track_count
+        self.limits: list[int | None] = []
+
+    def get_playlist(self, playlist_id: str, limit: int | None = 100) -> dict[str, typing.Any]:
+        self.limits.append(limit)
+        tracks = self.tracks if limit is None else self.tracks[:limit]
+        return {"id": playlist_id, "trackCount": self.track_count, "tracks": tracks}
+
+
+def _fetch(client: _CountingClient, tmp_path: Path) -> list[str]:
+    pages = playlist.iter_playlist(
+        "PLtest", None, tmp_path / "PLtest.json", page_size=100, client=client
+    )
+    return [mp3.url_id for page in pages for mp3 in page]
+
+
+def test_short_playlist_is_fetched_once(tmp_path: Path):
+    client = _CountingClient(40)
+    assert len(_fetch(client, tmp_path)) == 40
+    assert client.limits == [100]
+    assert (tmp_path / "PLtest.json").exists()
+
+
+def test_playlist_of_exactly_one_page_is_fetched_once(tmp_path: Path):
+    client = _CountingClient(100)
+    assert len(_fetch(client, tmp_path)) == 100
+    assert client.limits == [100]
+
+
+def test_long_playlist_fetches_the_first_page_then_the_rest(tmp_path: Path):
+    client = _CountingClient(250)
+    url_ids = _fetch(client, tmp_path)
+    assert url_ids == [f"v{i:04d}" for i in range(250)]
+    assert client.limits == [100, None]
+
+
+def test_refresh_skips_the_first_page(tmp_path: Path):
+    _fetch(_CountingClient(250), tmp_path)
+    client = _CountingClient(260)
+    pages = playlist.iter_playlist(
+        "PLtest", None, tmp_path / "PLtest.json", force_refresh=True, client=client
+    )
+    assert sum(len(page) for page in pages) == 260
+    assert client.limits == [None]
@@ -0,0 +1,35 @@
+import pytest
+from logic.rate_limit import is_throttled
+
+
+class _HttpError(Exception):
+    def __init__(self, code: int):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        Exception("ERROR: unable to download video data: HTTP Error 429: Too Many Requests"),
+        Exception("Server returned HTTP 429: Too Many Requests."),
+        Exception("Rate limit reached, try again later"),
+        _HttpError(429),
+    ],
+)
+def test_throttling_errors(error: Exception):
+    assert is_throttled(error)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        Exception("ERROR: [youtube] ab429cd: Video unavailable"),
+        Exception("Downloaded 14293 bytes of 1429000"),
+        Exception("Could not open temp/raw/v429.251.webm"),
+        Exception("HTTP Error 404: Not Found"),
+        _HttpError(503),
+    ],
+)
+def test_other_errors_are_not_throttling(error: Exception):
+    assert not is_throttled(error)
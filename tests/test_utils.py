@@ -0,0 +1,37 @@
+import io, logging, threading
+from pathlib import Path
+import utils
+
+
+class _ThreadRecorder:
+    """
+    A log argument remembering the threads that turned it into a string.
+    """
+
+    def __init__(self):
+        self.threads: list[str] = []
+
+    def __str__(self) -> str:
+        self.threads.append(threading.current_thread().name)
+        return "recorded"
+
+
+def test_queued_logger_formats_on_the_background_thread(tmp_path: Path):
+    stream = io.StringIO()
+    logger = utils.setup_logger(
+        "test_queued",
+        tmp_path / "log.txt",
+        file_level=logging.DEBUG,
+        console_level=logging.DEBUG,
+        queued=True,
+        console_stream=stream,
+    )
+    # pytest captures the records reaching the root logger, in the thread that logs.
+    logger.propagate = False
+    argument = _ThreadRecorder()
+    logger.debug("Argument %s", argument)
+    utils._stop_listener("test_queued", utils._listeners["test_queued"])
+
+    assert "Argument recorded" in stream.getvalue()
+    assert len(argument.threads) > 0
+    assert threading.current_thread().name not in argument.threads